@@ -0,0 +1,47 @@
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+# noinspection PyProtectedMember
+from loop._songconverter import SongConverter
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert songs saved as pickle files to song directories. "
+                                                 "Conversion may be stopped and started again")
+    parser.add_argument("dir_name", nargs="?", default=Path(Path(__file__).parent, "save_song"), type=Path,
+                        help="directory of songs")
+    parser.add_argument("-j", "--jobs", default=os.cpu_count(), type=int, help="number of processes")
+    parser.add_argument("-b", "--backup", default=None, type=Path,
+                        help="directory for pickle files, default is .legacy in directory of songs")
+    args = parser.parse_args()
+
+    backup_dir = args.backup or Path(args.dir_name, ".legacy")
+    paths = SongConverter.find_legacy(args.dir_name, ".sng")
+    print(f"Songs to convert: {len(paths)} in {args.dir_name}")
+    start = time.perf_counter()
+    before = after = failed = 0
+    with ProcessPoolExecutor(max(1, args.jobs)) as executor:
+        futures = {executor.submit(SongConverter.convert, x, backup_dir): x for x in paths}
+        for future in as_completed(futures):
+            # noinspection PyBroadException
+            try:
+                r = future.result()
+            except Exception as err:
+                logging.error(f"Failed to convert {futures[future].name}: {err}")
+                failed += 1
+                continue
+            before += r["before"]
+            after += r["after"]
+            print(f"{r['name']} {r['status']} {r['seconds']:.2f}s "
+                  f"{r['before']} -> {r['after']} bytes, saved {r['before'] - r['after']}")
+
+    print(f"Converted {len(paths) - failed} failed {failed} in {time.perf_counter() - start:.2f}s, "
+          f"{before} -> {after} bytes, saved {before - after}")
+
+
+if __name__ == "__main__":
+    main()
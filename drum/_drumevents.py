@@ -0,0 +1,40 @@
+import heapq
+import itertools
+import sys
+from collections import deque
+from typing import Callable, List, Tuple
+
+
+class DrumEvents:
+    """Drum changes queued at sample positions of drum clock. Any thread may add event,
+    events are run only by audio callback when its clock reaches them"""
+
+    def __init__(self):
+        self.__heap: List[Tuple[int, int, Callable[[], None]]] = []
+        self.__inbox: deque = deque()  # append and popleft are atomic, audio callback never waits
+        self.__seq = itertools.count()  # events at the same position run in order they were added
+
+    def add(self, at: int, action: Callable[[], None]) -> None:
+        self.__inbox.append((at, next(self.__seq), action))
+
+    def next_at(self) -> int:
+        """position of the first queued event"""
+        while self.__inbox:
+            heapq.heappush(self.__heap, self.__inbox.popleft())
+        return self.__heap[0][0] if self.__heap else sys.maxsize
+
+    def run_due(self, now: int) -> None:
+        """run events with position not after now, they may add new events"""
+        while self.next_at() <= now:
+            heapq.heappop(self.__heap)[2]()
+
+    def clear(self) -> None:
+        self.__inbox.clear()
+        self.__heap.clear()
+
+    def __len__(self):
+        return len(self.__heap) + len(self.__inbox)
+
+
+if __name__ == "__main__":
+    pass
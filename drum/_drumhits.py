@@ -0,0 +1,43 @@
+from typing import List
+
+import numpy as np
+
+
+class DrumHits:
+    """Drum pattern compiled to hits: sample offset in bar, sound id and gain of each hit.
+    Hits are mixed into output when played, nothing is rendered in advance"""
+
+    def __init__(self, offsets: List[int], sound_ids: List[int], gains: List[float], lengths: List[int]):
+        self.offsets: np.ndarray = np.array(offsets, np.int64)
+        self.sound_ids: np.ndarray = np.array(sound_ids, np.int32)
+        self.gains: np.ndarray = np.array(gains, np.float32)
+        self.lengths: np.ndarray = np.array(lengths, np.int64)  # sound length, not longer than bar
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def play(self, sounds: List[np.ndarray], out_data: np.ndarray, idx: int, length: int, volume: float) -> None:
+        """mix hits heard from idx into out_data, sounds longer than rest of bar go into next bar"""
+        data_len = len(out_data)
+        pos = idx % length
+        starts = (self.offsets - pos) % length  # hit starts in this block
+        played = (pos - self.offsets) % length  # hit started before this block and still sounds
+
+        for k in np.flatnonzero(starts < data_len):
+            start = starts[k]
+            count = min(self.lengths[k], data_len - start)
+            sound = sounds[self.sound_ids[k]]
+            out_data[start:start + count] += (sound[:count] * (self.gains[k] * volume)).astype(out_data.dtype)
+
+        for k in np.flatnonzero((played > 0) & (played < self.lengths)):
+            start = played[k]
+            count = min(self.lengths[k] - start, data_len)
+            sound = sounds[self.sound_ids[k]]
+            out_data[:count] += (sound[start:start + count] * (self.gains[k] * volume)).astype(out_data.dtype)
+
+    def __str__(self):
+        return f"{self.__class__.__name__} hits={len(self)}"
+
+
+if __name__ == "__main__":
+    pass
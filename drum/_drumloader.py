@@ -1,167 +1,291 @@
 import logging
 import os
-import random
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Any, Dict, Union, Tuple
+from threading import Lock, Thread
+from typing import List, Dict, Union, Tuple
 
 import numpy as np
-import soundfile as sf
 
-from utils import JsonDictLoader, make_zero_buffer, record_sound_buff, MainLoader, SD_TYPE
+from drum._drumhits import DrumHits
+from drum._drumset import DrumSet, DrumPattern
+from drum._soundcache import SoundCache
+from drum._stepmatrix import StepMatrix
+from utils import JsonDictLoader, record_sound_buff, play_sound_buff, MainLoader, SD_TYPE, MIX_TYPE
 from utils import SD_MAX, always_true, ConfigName
 
 
-def extend_list(some_list: Union[List, str], new_len: int) -> List:
-    """replicate or shrink list or string to a new length"""
-    k = -(-new_len // len(some_list))
-    return (some_list * k)[:new_len]
-
-
 class DrumLoader:
-    """ class will only static methods to load drum patterns """
+    """ class will only static methods to load drum patterns.
+    In render mode patterns are rendered to bar long buffers,
+    in sequencer mode they are compiled to hits mixed at playback.
+    New patterns are prepared aside in parallel and swapped in at bar boundary"""
 
     max_volume: float = 0
     length: int = 0
+    is_sequencer: bool = MainLoader.get(ConfigName.drum_mode, "render") == "sequencer"
+    volume: float = MainLoader.get(ConfigName.drum_volume, 1)  # applied as gain when drums are mixed
     __sounds: Dict[str, Tuple[np.ndarray, float]] = dict()
-    __l1: int = 0
-    __l2: int = 0
-    __bk: int = 0
-    __ptn_l1: List[Dict[str, Any]] = []
-    __ptn_l2: List[Dict[str, Any]] = []
-    __ptn_bk: List[Dict[str, Any]] = []
-    __snd_l1: List[np.ndarray] = []
-    __snd_l2: List[np.ndarray] = []
-    __snd_bk: List[np.ndarray] = []
+    __ptn_l1: List[StepMatrix] = []
+    __ptn_l2: List[StepMatrix] = []
+    __ptn_bk: List[StepMatrix] = []
+    __styles: Dict[str, Tuple[List, List[StepMatrix], List[StepMatrix], List[StepMatrix]]] = dict()
+    __sound_list: List[np.ndarray] = []
+    __now: DrumSet = DrumSet()  # played by audio callback
+    __pending: Union[DrumSet, None] = None  # swapped in at next bar boundary
+    __generation: int = 0  # set prepared for older generation is not used
+    __lock: Lock = Lock()
+    __executor: ThreadPoolExecutor = ThreadPoolExecutor(os.cpu_count(), "drum_render")
+    __cache: OrderedDict = OrderedDict()
+    cache_mb: float = 64  # memory for rendered patterns of previous drum types and swings
 
     @staticmethod
     def random_samples():
-        DrumLoader.__l2 = random.randrange(len(DrumLoader.__snd_l2))
-        DrumLoader.__l1 = random.randrange(len(DrumLoader.__snd_l1))
-        DrumLoader.__bk = random.randrange(len(DrumLoader.__snd_bk))
+        DrumLoader.__now.random_samples()
+
+    @staticmethod
+    def get_l1() -> DrumPattern:
+        return DrumLoader.__now.l1[DrumLoader.__now.k1]
+
+    @staticmethod
+    def get_l2() -> DrumPattern:
+        return DrumLoader.__now.l2[DrumLoader.__now.k2]
+
+    @staticmethod
+    def get_bk() -> DrumPattern:
+        return DrumLoader.__now.bk[DrumLoader.__now.kb]
+
+    @staticmethod
+    def play_l1(out_data: np.ndarray, idx: int) -> None:
+        now = DrumLoader.__now
+        if now.length > 0:
+            DrumLoader.__play(now, now.l1[now.k1], out_data, idx)
+
+    @staticmethod
+    def play_l2(out_data: np.ndarray, idx: int) -> None:
+        now = DrumLoader.__now
+        if now.length > 0:
+            DrumLoader.__play(now, now.l2[now.k2], out_data, idx)
+
+    @staticmethod
+    def play_bk(out_data: np.ndarray, idx: int) -> None:
+        now = DrumLoader.__now
+        if now.length > 0:
+            DrumLoader.__play(now, now.bk[now.kb], out_data, idx)
+
+    @staticmethod
+    def __play(now: DrumSet, pattern: DrumPattern, out_data: np.ndarray, idx: int) -> None:
+        """callback reads played set once, set may be replaced by control thread meanwhile"""
+        if isinstance(pattern, DrumHits):
+            pattern.play(DrumLoader.__sound_list, out_data, idx, now.length, 1)
+        else:
+            play_sound_buff(pattern, out_data, idx)
 
     @staticmethod
-    def get_l1() -> np.ndarray:
-        return DrumLoader.__snd_l1[DrumLoader.__l1]
+    def swap_pos(idx: int, data_len: int) -> int:
+        """position in audio block where bar starts if prepared set waits for it, otherwise -1"""
+        now = DrumLoader.__now
+        if DrumLoader.__pending is None or now.length == 0:
+            return -1
+        pos = -idx % now.length
+        return pos if pos < data_len else -1
 
     @staticmethod
-    def get_l2() -> np.ndarray:
-        return DrumLoader.__snd_l2[DrumLoader.__l2]
+    def swap() -> None:
+        """called by audio callback at bar boundary, it does not wait if set is being published"""
+        if not DrumLoader.__lock.acquire(blocking=False):
+            return
+        if DrumLoader.__pending is not None:
+            DrumLoader.__pending.keep_samples(DrumLoader.__now)
+            DrumLoader.__now, DrumLoader.__pending = DrumLoader.__pending, None
+        DrumLoader.__lock.release()
 
     @staticmethod
-    def get_bk() -> np.ndarray:
-        return DrumLoader.__snd_bk[DrumLoader.__bk]
+    def clear() -> None:
+        """drums are empty before empty set is published, so callback stops playing them first"""
+        with DrumLoader.__lock:
+            DrumLoader.__generation += 1
+            DrumLoader.length = 0
+            DrumLoader.__now, DrumLoader.__pending = DrumSet(), None
 
     @staticmethod
-    def load(dir_name: Path) -> None:
+    def load(dir_name: Path) -> bool:
+        """Drum type is compiled once, switching back to it is a lookup while its files are not changed.
+        Drum type without correct patterns is not used, previous one is kept and False is returned"""
         assert always_true(f"Loading drum {dir_name}")
         if len(DrumLoader.__sounds) == 0:
             DrumLoader.__load_sounds(dir_name)
             assert always_true(f"Loaded drum sounds {len(DrumLoader.__sounds)}")
-        DrumLoader.__load_all_patterns(dir_name, "drum_level1", DrumLoader.__ptn_l1)
-        DrumLoader.__load_all_patterns(dir_name, "drum_level2", DrumLoader.__ptn_l2)
-        DrumLoader.__load_all_patterns(dir_name, "drum_break", DrumLoader.__ptn_bk)
+        file_names = [os.path.join(dir_name, x + ".json") for x in ["drum_level1", "drum_level2", "drum_break"]]
+        key = [os.stat(x).st_mtime_ns if os.path.isfile(x) else 0 for x in file_names]
+        style = DrumLoader.__styles.get(str(dir_name))
+        if style is None or style[0] != key:
+            try:
+                style = (key, *[DrumLoader.__load_all_patterns(x) for x in file_names])
+            except ValueError as err:
+                if not DrumLoader.__ptn_l1:
+                    raise
+                logging.error(f"Drum {dir_name} is not loaded, previous drum is kept: {err}")
+                return False
+            DrumLoader.__styles[str(dir_name)] = style
+        _, DrumLoader.__ptn_l1, DrumLoader.__ptn_l2, DrumLoader.__ptn_bk = style
         assert always_true(f"Loaded drum patterns {len(DrumLoader.__ptn_l1)}")
+        return True
 
     @staticmethod
     def __load_sounds(dir_name: Path) -> None:
-        """Loads WAV sounds"""
+        """Loads WAV sounds from cache of decoded sounds"""
         path = os.path.join(dir_name.parent, "drum_sounds.json")
-        loader = JsonDictLoader(path)
-        for name in loader.get_keys():
-            drum_sound = loader.get(name, dict())
-            assert len(drum_sound) > 0
-            assert type(drum_sound) == dict
-            file_name = drum_sound["file_name"]
-            file_name = Path(loader.get_filename().parent, file_name)
-            v1: float = drum_sound.get("volume", 1.0)
-
-            (sound, _) = sf.read(str(file_name), dtype="int16", always_2d=True)
-            assert sound.ndim == 2
-            assert sound.shape[1] == 2
-            v2: float = np.max(sound)
+        for name, (sound, v1, v2) in SoundCache.load(Path(path)).items():
             DrumLoader.max_volume = max(DrumLoader.max_volume, v1 * v2)
             assert DrumLoader.max_volume < SD_MAX
-            #  assert always_true(f"Loaded sound {file_name}")
             DrumLoader.__sounds[name] = (sound, v1)
+        DrumLoader.__sound_list = [x for x, _ in DrumLoader.__sounds.values()]
 
     @staticmethod
-    def __load_all_patterns(dir_name: Path, file_name: str, storage: List[Dict]) -> None:
-        storage.clear()
-        path = os.path.join(dir_name, file_name + ".json")
+    def __load_all_patterns(path: str) -> List[StepMatrix]:
+        """Incorrect pattern is reported and skipped here, not when it is played.
+        File without correct patterns raises ValueError"""
+        storage = []
         loader = JsonDictLoader(path)
         default = loader.get(ConfigName.default_pattern, dict())
         for key in [x for x in loader.get_keys() if x not in [ConfigName.comment, ConfigName.default_pattern]]:
             value = loader.get(key, None)
-            assert type(value) == dict, f"Must be dictionary {key}"
-            assert len(value) > 0, f"Dictionary must be non empty {key}"
-            value = dict(default, **value)
-            value["name"] = key
-            value["___"] = ""
-            steps: int = value["steps"]
-            accents: str = value["accents"]
-            value["accents"] = extend_list(accents, steps)
-            for sound_name in [x for x in DrumLoader.__sounds if x in value]:
-                value[sound_name] = extend_list(value[sound_name], steps)
-            storage.append(value)
+            if type(value) != dict or len(value) == 0:
+                logging.error(f"Pattern {key} in {path} must be non empty dictionary")
+                continue
+            try:
+                storage.append(StepMatrix(key, dict(default, **value), list(DrumLoader.__sounds)))
+            except ValueError as err:
+                logging.error(f"Skipped pattern in {path}: {err}")
+        if len(storage) == 0:
+            raise ValueError(f"No correct patterns in {path}")
+        return storage
 
     @staticmethod
     def prepare_all(length: int) -> None:
-        DrumLoader.length = 0
+        """Prepare all patterns in parallel into new set. It replaces played set at once
+        if drums are empty or bar length changes, otherwise at next bar boundary"""
+        with DrumLoader.__lock:
+            DrumLoader.__generation += 1
+            generation = DrumLoader.__generation
         if length == 0:
             return
 
-        for i in [DrumLoader.__snd_l1, DrumLoader.__snd_l2, DrumLoader.__snd_bk]:
-            i.clear()
+        drum_set = DrumLoader.prepare_set(length)
+        with DrumLoader.__lock:
+            if generation != DrumLoader.__generation:
+                return
+            if DrumLoader.__now.length != length:
+                drum_set.random_samples()
+                DrumLoader.__now, DrumLoader.__pending = drum_set, None
+                DrumLoader.length = length
+            else:
+                drum_set.keep_samples(DrumLoader.__now)
+                DrumLoader.__pending = drum_set
 
-        for i in DrumLoader.__ptn_l1:
-            DrumLoader.__snd_l1.append(DrumLoader.__prepare_one(i, length))
+    @staticmethod
+    def prepare_set(length: int) -> DrumSet:
+        """all patterns for bar length prepared in parallel, set is not played until it is published"""
+        if length == 0:
+            return DrumSet()
+        swing = MainLoader.get(ConfigName.drum_swing, 0.625)
+        prepare = DrumLoader.__compile_one if DrumLoader.is_sequencer else DrumLoader.__render_cached
+        ptn_lists = [DrumLoader.__ptn_l1, DrumLoader.__ptn_l2, DrumLoader.__ptn_bk]
+        futures = [[DrumLoader.__executor.submit(prepare, x, length, swing) for x in ptn] for ptn in ptn_lists]
+        drum_set = DrumSet(length, *[[x.result() for x in lst] for lst in futures])
+        assert always_true(f"Prepared {drum_set} cached {len(DrumLoader.__cache)}")
+        return drum_set
 
-        for i in DrumLoader.__ptn_l2:
-            DrumLoader.__snd_l2.append(DrumLoader.__prepare_one(i, length))
+    @staticmethod
+    def use_set(drum_set: DrumSet) -> bool:
+        """called by audio callback when song changes, set made by prepare_set is played at once.
+        It does not wait if set is being published, returns False then"""
+        if not DrumLoader.__lock.acquire(blocking=False):
+            return False
+        DrumLoader.__generation += 1
+        drum_set.random_samples()
+        DrumLoader.__now, DrumLoader.__pending = drum_set, None
+        DrumLoader.length = drum_set.length
+        DrumLoader.__lock.release()
+        return True
 
-        for i in DrumLoader.__ptn_bk:
-            DrumLoader.__snd_bk.append(DrumLoader.__prepare_one(i, length))
+    @staticmethod
+    def prepare_later(length: int) -> None:
+        """control thread does not wait for patterns"""
+        if length > 0:
+            Thread(target=DrumLoader.prepare_all, args=[length], name="drum_prepare", daemon=True).start()
 
-        assert always_true(f"Generated drum patterns {len(DrumLoader.__snd_l1)}")
+    @staticmethod
+    def warm_up(length: int) -> None:
+        """Render patterns for bar length of next song into cache, played set is not changed"""
+        if length == 0 or DrumLoader.is_sequencer:
+            return
+        swing = MainLoader.get(ConfigName.drum_swing, 0.625)
+        patterns = [*DrumLoader.__ptn_l1, *DrumLoader.__ptn_l2, *DrumLoader.__ptn_bk]
+        for future in [DrumLoader.__executor.submit(DrumLoader.__render_cached, x, length, swing) for x in patterns]:
+            future.result()
 
-        DrumLoader.random_samples()
-        DrumLoader.length = length
+    @staticmethod
+    def __find_hits(pattern: StepMatrix, length: int, swing: float) -> List[Tuple[str, np.ndarray, np.ndarray]]:
+        """Positions of hits of each sound and their volume before drum volume and division by 9.
+        Every even 16th note is shifted to make it swing like"""
+        step_len = length / pattern.steps
+        result = []
+        for sound_name, hits in zip(pattern.sounds, pattern.hits):
+            step_numbers = np.flatnonzero(hits)
+            positions = np.round(step_numbers * step_len + (step_numbers % 2) * (step_len * (swing - 0.5)))
+            volumes = DrumLoader.__sounds[sound_name][1] * pattern.accents[step_numbers]
+            result.append((sound_name, positions.astype(np.int64), volumes))
+        return result
 
     @staticmethod
-    def __prepare_one(pattern, length: int) -> np.ndarray:
-        accents = pattern["accents"]
-        ndarr = make_zero_buffer(length)
-        drum_volume = MainLoader.get(ConfigName.drum_volume, 1)
-        for sound_name in [x for x in DrumLoader.__sounds if x in pattern]:
-            notes = pattern[sound_name]
-            steps = len(notes)
-            if notes.count("!") + notes.count(".") != steps:
-                logging.error(f"sound {sound_name} notes {notes} must contain only '.' and '!'")
+    def __compile_one(pattern: StepMatrix, length: int, swing: float) -> DrumHits:
+        """hits at unity drum volume"""
+        sound_ids = {x: k for k, x in enumerate(DrumLoader.__sounds)}
+        offsets, ids, gains, lengths = [], [], [], []
+        for sound_name, positions, volumes in DrumLoader.__find_hits(pattern, length, swing):
+            offsets.extend(positions % length)
+            ids.extend([sound_ids[sound_name]] * len(positions))
+            gains.extend(volumes / 9.0)
+            lengths.extend([min(len(DrumLoader.__sounds[sound_name][0]), length)] * len(positions))
 
-            step_len = length / steps
-            sound, sound_volume = DrumLoader.__sounds[sound_name]
-            sound = sound[:length]
-            assert sound.ndim == 2 and sound.shape[1] == 2
-            assert 0 < sound.shape[0] <= length, f"Must be: 0 < {sound.shape[0]} <= {length}"
+        return DrumHits(offsets, ids, gains, lengths)
 
-            for step_number in range(steps):
-                if notes[step_number] != '.':
-                    step_accent = int(accents[step_number])
-                    step_volume = sound_volume * step_accent * drum_volume / 9.0
-                    pos = DrumLoader.__pos_with_swing(step_number, step_len)
-                    tmp = (sound * step_volume).astype(SD_TYPE)
-                    record_sound_buff(ndarr, tmp, pos)
+    @staticmethod
+    def __render_cached(pattern: StepMatrix, length: int, swing: float) -> np.ndarray:
+        """rendered patterns are kept in LRU cache, so going back to previous drum type or swing is fast"""
+        key = (pattern.key, length, swing)
+        with DrumLoader.__lock:
+            ndarr = DrumLoader.__cache.pop(key, None)
+        if ndarr is None:
+            ndarr = DrumLoader.__render_one(pattern, length, swing)
 
+        with DrumLoader.__lock:
+            DrumLoader.__cache[key] = ndarr
+            cache_bytes = sum(x.nbytes for x in DrumLoader.__cache.values())
+            while cache_bytes > DrumLoader.cache_mb * 1024 * 1024 and len(DrumLoader.__cache) > 1:
+                cache_bytes -= DrumLoader.__cache.popitem(last=False)[1].nbytes
         return ndarr
 
     @staticmethod
-    def __pos_with_swing(step_number, step_len) -> int:
-        """shift every even 16th note to make it swing like"""
-        if step_number % 2 == 0:
-            return round(step_number * step_len)
-        else:
-            swing_delta = step_len * (MainLoader.get(ConfigName.drum_swing, 0.625) - 0.5)
-            return round(step_number * step_len + swing_delta)
+    def __render_one(pattern: StepMatrix, length: int, swing: float) -> np.ndarray:
+        """Each sound is scaled once per accent level. Pattern is rendered at unity drum volume,
+        sounds are added in 32 bits and clipped once"""
+        ndarr = np.zeros((length, 2), MIX_TYPE)
+        for sound_name, positions, volumes in DrumLoader.__find_hits(pattern, length, swing):
+            sound = DrumLoader.__sounds[sound_name][0][:length]
+            assert sound.ndim == 2 and sound.shape[1] == 2
+            assert 0 < sound.shape[0] <= length, f"Must be: 0 < {sound.shape[0]} <= {length}"
+
+            for volume in np.unique(volumes):
+                tmp = (sound * (volume / 9.0)).astype(MIX_TYPE)
+                for pos in positions[volumes == volume]:
+                    record_sound_buff(ndarr, tmp, int(pos))
+
+        np.clip(ndarr, -SD_MAX - 1, SD_MAX, out=ndarr)
+        return ndarr.astype(SD_TYPE)
 
 
 if __name__ == "__main__":
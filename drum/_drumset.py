@@ -0,0 +1,43 @@
+import random
+from typing import List, Union
+
+import numpy as np
+
+from drum._drumhits import DrumHits
+
+DrumPattern = Union[np.ndarray, DrumHits]
+
+
+class DrumSet:
+    """Rendered bars or compiled hits of level1, level2 and break patterns for one bar length.
+    Audio callback plays one set, next set is prepared aside and swapped in as a whole"""
+
+    def __init__(self, length: int = 0, l1: List[DrumPattern] = (), l2: List[DrumPattern] = (),
+                 bk: List[DrumPattern] = ()):
+        self.length: int = length
+        self.l1: List[DrumPattern] = list(l1)
+        self.l2: List[DrumPattern] = list(l2)
+        self.bk: List[DrumPattern] = list(bk)
+        self.k1: int = 0
+        self.k2: int = 0
+        self.kb: int = 0
+
+    def random_samples(self) -> None:
+        if self.length > 0:
+            self.k2 = random.randrange(len(self.l2))
+            self.k1 = random.randrange(len(self.l1))
+            self.kb = random.randrange(len(self.bk))
+
+    def keep_samples(self, other: "DrumSet") -> None:
+        """continue with the same patterns as other set if it has them"""
+        if (len(self.l1), len(self.l2), len(self.bk)) == (len(other.l1), len(other.l2), len(other.bk)):
+            self.k1, self.k2, self.kb = other.k1, other.k2, other.kb
+        else:
+            self.random_samples()
+
+    def __str__(self):
+        return f"{self.__class__.__name__} length={self.length} patterns={len(self.l1)} {len(self.l2)} {len(self.bk)}"
+
+
+if __name__ == "__main__":
+    pass
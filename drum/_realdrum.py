@@ -1,12 +1,14 @@
 import random
 from enum import IntEnum
-from threading import Timer
+from typing import Union
 
 import numpy as np
 
+from drum._drumevents import DrumEvents
 from drum._drumloader import DrumLoader
+from drum._drumset import DrumSet
 from utils import MAX_32_INT, ConfigName, MainLoader, FileFinder, SD_MAX
-from utils import SD_RATE, play_sound_buff
+from utils import MixBus, GainStage
 
 
 class Intensity(IntEnum):
@@ -57,6 +59,17 @@ class FakeDrum:
     def prepare_drum(self, length: int) -> None:
         pass
 
+    @staticmethod
+    def warm_up(length: int) -> None:
+        pass
+
+    @staticmethod
+    def prepare_set(length: int) -> Union[DrumSet, None]:
+        return None
+
+    def use_set(self, drum_set: Union[DrumSet, None]) -> None:
+        pass
+
     def play_samples(self, out_data: np.ndarray, idx: int) -> None:
         pass
 
@@ -81,9 +94,15 @@ class RealDrum(FakeDrum):
     def __init__(self):
         super().__init__()
         self.__change_after_samples: int = MAX_32_INT
-        self.__sample_counter: int = 0
+        self.__random_at: int = MAX_32_INT  # clock position of next random change of patterns
         self.__i: Intensity = Intensity.LVL2
         self.__is_break_pending: bool = False
+        self.__clock: int = 0  # samples played by drums, events are scheduled in this clock
+        self.__idx_offset: int = 0  # clock minus idx of part being played
+        self.__events: DrumEvents = DrumEvents()
+        self.__bus: MixBus = MixBus()  # drums are mixed here at unity and added to output with gain
+        self.__gain: GainStage = GainStage(DrumLoader.volume)
+        self.__next_set: Union[DrumSet, None] = None  # set of next song, callback publishes it
 
         self.__file_finder = FileFinder("etc/drums", False, "", MainLoader.get(ConfigName.drum_type, "pop"))
         tmp = self.__file_finder.get_path_now()
@@ -91,7 +110,12 @@ class RealDrum(FakeDrum):
 
     @staticmethod
     def clear() -> None:
-        DrumLoader.length = 0
+        DrumLoader.clear()
+
+    @staticmethod
+    def warm_up(length: int) -> None:
+        """drums of next song are prepared at once when it starts"""
+        DrumLoader.warm_up(length)
 
     @staticmethod
     def change_volume(change_by: int) -> None:
@@ -103,7 +127,7 @@ class RealDrum(FakeDrum):
             return
         MainLoader.set(ConfigName.drum_volume, v)
         MainLoader.save()
-        DrumLoader.prepare_all(DrumLoader.length)
+        DrumLoader.volume = v
 
     @staticmethod
     def change_swing(change_by: int) -> None:
@@ -116,7 +140,7 @@ class RealDrum(FakeDrum):
 
         MainLoader.set(ConfigName.drum_swing, v)
         MainLoader.save()
-        DrumLoader.prepare_all(DrumLoader.length)
+        DrumLoader.prepare_later(DrumLoader.length)
 
     @property
     def is_empty(self) -> bool:
@@ -146,51 +170,106 @@ class RealDrum(FakeDrum):
         self.__file_finder.now = self.__file_finder.next
         tmp = self.__file_finder.get_path_now()
 
-        DrumLoader.load(tmp)
+        if not DrumLoader.load(tmp):
+            return
         MainLoader.set(ConfigName.drum_type, self.__file_finder.get_item_now())
         MainLoader.save()
 
-        if not self.is_empty:
-            self.prepare_drum(self.length)
+        DrumLoader.prepare_later(self.length)
 
     def prepare_drum(self, length: int) -> None:
         """ Non blocking drum init in another thread, length is one bar long and holds drum pattern """
-        Timer(0.2, DrumLoader.prepare_all, [length]).start()
+        DrumLoader.prepare_later(length)
         self.__change_after_samples = RealDrum.change_after_bars * length
+        self.__events.add(self.__clock, self.__reset)
+
+    @staticmethod
+    def prepare_set(length: int) -> DrumSet:
+        """drums for bar length of next song, they are not played until use_set"""
+        return DrumLoader.prepare_set(length)
+
+    def use_set(self, drum_set: DrumSet) -> None:
+        """called by audio callback when song changes, only prepared set is published.
+        If loader is busy set is published in next block, drums are silent until then"""
+        self.__next_set = drum_set
+        self.__publish_set()
+
+    def __publish_set(self) -> bool:
+        if not DrumLoader.use_set(self.__next_set):
+            return False
+        self.__change_after_samples = RealDrum.change_after_bars * self.__next_set.length
+        self.__events.add(self.__clock, self.__reset)
+        self.__next_set = None
+        return True
+
+    def __reset(self) -> None:
         self.__i = Intensity.LVL2
+        self.__random_samples()
 
     def play_samples(self, out_data: np.ndarray, idx: int) -> None:
-        if self.__i == Intensity.SILENT or self.is_empty:
+        """block is split at positions of queued events, so they happen at exact sample"""
+        if self.__next_set is not None and not self.__publish_set():
+            return
+        if self.is_empty:
             return
 
-        self.__sample_counter += len(out_data)
-        if self.__sample_counter > self.__change_after_samples:
-            self.__random_samples()
+        self.__idx_offset = self.__clock - idx
+        block = self.__bus.get_block(len(out_data))
+        start = 0
+        while start < len(block):
+            self.__events.run_due(self.__clock)
+            end = min(len(block), start + self.__events.next_at() - self.__clock)
+            self.__play_part(block[start:end], idx + start)
+            self.__clock += end - start
+            start = end
+        self.__gain.add_into(block, out_data, DrumLoader.volume)
+
+    def __play_part(self, out_data: np.ndarray, idx: int) -> None:
+        pos = DrumLoader.swap_pos(idx, len(out_data))
+        if pos >= 0:
+            self.__play_set(out_data[:pos], idx)
+            DrumLoader.swap()
+            self.__play_set(out_data[pos:], idx + pos)
+        else:
+            self.__play_set(out_data, idx)
+
+    def __play_set(self, out_data: np.ndarray, idx: int) -> None:
+        if self.__i == Intensity.SILENT or len(out_data) == 0:
+            return
 
         if self.__i & Intensity.LVL1:
-            play_sound_buff(DrumLoader.get_l1(), out_data, idx)
+            DrumLoader.play_l1(out_data, idx)
         if self.__i & Intensity.LVL2:
-            play_sound_buff(DrumLoader.get_l2(), out_data, idx)
+            DrumLoader.play_l2(out_data, idx)
         if self.__i & Intensity.BREAK:
-            play_sound_buff(DrumLoader.get_bk(), out_data, idx)
+            DrumLoader.play_bk(out_data, idx)
 
     def play_break_later(self, part_len: int, idx: int) -> None:
+        """break starts half bar before end of part"""
         if self.__is_break_pending:
             return
 
         bars = 0.5
-        samples = self.length * bars
-        idx %= part_len
-        start_at = (part_len - idx) - samples
+        samples = round(self.length * bars)
+        start_at = (part_len - idx % part_len) - samples
         if start_at > 0:
             self.__is_break_pending = True
-            Timer(start_at / SD_RATE, self.play_break_now, [bars]).start()
+            self.__events.add(idx + start_at + self.__idx_offset, lambda: self.__start_break(bars))
 
     def __random_samples(self) -> None:
-        self.__sample_counter = 0
+        """patterns change every change_after_samples, break restarts this period"""
         DrumLoader.random_samples()
+        self.__random_at = self.__clock + self.__change_after_samples
+        self.__events.add(self.__random_at, self.__random_due)
+
+    def __random_due(self) -> None:
+        if self.__clock >= self.__random_at:
+            self.__random_samples()
 
     def play_break_now(self, bars: float = 0) -> None:
+        self.__events.add(self.__clock, lambda: self.__start_break(bars))
+
+    def __start_break(self, bars: float) -> None:
         if self.__i == Intensity.SILENT:
             self.__i = Intensity.LVL2
 
@@ -202,14 +281,16 @@ class RealDrum(FakeDrum):
         self.__i |= Intensity.BREAK
         if bars <= 0:
             bars = 0.5 if random.random() < 0.5 else 1
-        samples = self.length * bars
-        Timer(samples / SD_RATE, revert).start()
+        self.__events.add(self.__clock + round(self.length * bars), revert)
 
     def change_intensity(self, change_by: int) -> None:
-        i = self.__i + change_by
-        i = min(3, i)
-        i = max(0, i)
-        self.__i = i
+        def change():
+            i = self.__i + change_by
+            i = min(3, i)
+            i = max(0, i)
+            self.__i = i
+
+        self.__events.add(self.__clock, change)
 
     def __str__(self):
         return f"RealDrum length: {self.length} empty: {self.is_empty} intensity: {self.__i}"
@@ -0,0 +1,108 @@
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Tuple, Any
+
+import numpy as np
+import soundfile as sf
+
+from utils import JsonDictLoader, SD_RATE, SD_TYPE, always_true
+
+
+class SoundCache:
+    """class will only static methods. Decoded drum sounds converted to SD_RATE stereo are kept
+    in one blob next to drum_sounds.json and memory mapped on start. Blob is made again if
+    JSON, any WAV file or SD_RATE changes"""
+
+    @staticmethod
+    def load(json_path: Path) -> Dict[str, Tuple[np.ndarray, float, float]]:
+        """returns sound, volume from JSON and peak for each sound name"""
+        loader = JsonDictLoader(json_path)
+        json_dir = loader.get_filename().parent
+        blob_path = Path(json_dir, "drum_sounds.cache.npy")
+        index_path = Path(json_dir, "drum_sounds.cache.json")
+        key = SoundCache.__make_key(loader)
+
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+            if index["key"] == key:
+                blob = np.load(blob_path, mmap_mode='r')
+                assert always_true(f"Mapped drum sounds {blob_path}")
+                return {name: (blob[start:start + length], volume, peak)
+                        for name, (start, length, volume, peak) in index["sounds"].items()}
+        except (OSError, ValueError, KeyError):
+            pass
+
+        sounds = SoundCache.__decode(loader)
+        SoundCache.__save(sounds, key, blob_path, index_path)
+        return sounds
+
+    @staticmethod
+    def __make_key(loader: JsonDictLoader) -> Dict[str, Any]:
+        files = dict()
+        for name in loader.get_keys():
+            file_name = Path(loader.get_filename().parent, loader.get(name, dict())["file_name"])
+            stat = os.stat(file_name)
+            files[str(file_name.name)] = [stat.st_mtime_ns, stat.st_size]
+        json_dict = {name: loader.get(name, None) for name in loader.get_keys()}
+        return {"sd_rate": SD_RATE, "json": json_dict, "files": files}
+
+    @staticmethod
+    def __decode(loader: JsonDictLoader) -> Dict[str, Tuple[np.ndarray, float, float]]:
+        sounds = dict()
+        for name in loader.get_keys():
+            drum_sound = loader.get(name, dict())
+            assert len(drum_sound) > 0
+            assert type(drum_sound) == dict
+            file_name = Path(loader.get_filename().parent, drum_sound["file_name"])
+            (sound, rate) = sf.read(str(file_name), dtype="int16", always_2d=True)
+            sound = SoundCache.__to_stereo(SoundCache.__resample(sound, rate))
+            sounds[name] = (sound, drum_sound.get("volume", 1.0), float(np.max(sound)))
+        assert always_true(f"Decoded drum sounds {len(sounds)}")
+        return sounds
+
+    @staticmethod
+    def __resample(sound: np.ndarray, rate: int) -> np.ndarray:
+        """linear interpolation is good enough for short drum hits"""
+        if rate == SD_RATE:
+            return sound
+        new_len = round(len(sound) * SD_RATE / rate)
+        x_new = np.arange(new_len) * (rate / SD_RATE)
+        x_old = np.arange(len(sound))
+        columns = [np.interp(x_new, x_old, sound[:, k]) for k in range(sound.shape[1])]
+        return np.round(np.column_stack(columns)).astype(SD_TYPE)
+
+    @staticmethod
+    def __to_stereo(sound: np.ndarray) -> np.ndarray:
+        if sound.shape[1] == 1:
+            return np.column_stack((sound, sound))
+        assert sound.shape[1] == 2, "drum sound must be mono or stereo"
+        return sound
+
+    @staticmethod
+    def __save(sounds: Dict[str, Tuple[np.ndarray, float, float]], key: Dict[str, Any],
+               blob_path: Path, index_path: Path) -> None:
+        """files are written under temporary names and renamed, so a half written cache is never used"""
+        index = {"key": key, "sounds": dict()}
+        start = 0
+        for name, (sound, volume, peak) in sounds.items():
+            index["sounds"][name] = [start, len(sound), volume, peak]
+            start += len(sound)
+
+        try:
+            blob = np.concatenate([x for x, _, _ in sounds.values()], axis=0)
+            with open(str(blob_path) + ".tmp", "wb") as f:
+                np.save(f, blob)
+            with open(str(index_path) + ".tmp", "w") as f:
+                json.dump(index, f)
+            index_path.unlink(missing_ok=True)
+            os.replace(str(blob_path) + ".tmp", blob_path)
+            os.replace(str(index_path) + ".tmp", index_path)
+        except OSError as err:
+            logging.error(f"Failed to save drum sound cache {blob_path}: {err}")
+
+
+if __name__ == "__main__":
+    pass
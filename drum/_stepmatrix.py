@@ -0,0 +1,44 @@
+from typing import Dict, Any, List, Tuple, Union
+
+import numpy as np
+
+
+def extend_list(some_list: Union[List, str], new_len: int) -> List:
+    """replicate or shrink list or string to a new length"""
+    k = -(-new_len // len(some_list))
+    return (some_list * k)[:new_len]
+
+
+class StepMatrix:
+    """Drum pattern compiled and validated once when drum type is loaded.
+    Row of hits matrix is one sound, column is one step. Accents are from 0 to 9"""
+
+    def __init__(self, name: str, pattern: Dict[str, Any], sound_names: List[str]):
+        """pattern is JSON dictionary merged with default pattern, raises ValueError if it is not correct"""
+        self.name: str = name
+        steps = pattern.get("steps")
+        if type(steps) != int or steps <= 0:
+            raise ValueError(f"pattern {name} steps must be positive integer, got {steps}")
+
+        accents = str(pattern.get("accents", ""))
+        if len(accents) == 0 or not accents.isdigit():
+            raise ValueError(f"pattern {name} accents must be digits from 0 to 9, got '{accents}'")
+
+        self.steps: int = steps
+        self.accents: np.ndarray = np.array([int(x) for x in extend_list(accents, steps)], np.int32)
+        self.sounds: Tuple[str, ...] = tuple(x for x in sound_names if x in pattern)
+        self.hits: np.ndarray = np.zeros((len(self.sounds), steps), bool)
+        for k, sound_name in enumerate(self.sounds):
+            notes = pattern[sound_name]
+            if type(notes) != str or len(notes) == 0 or notes.count("!") + notes.count(".") != len(notes):
+                raise ValueError(f"pattern {name} sound {sound_name} notes must contain only '.' and '!'")
+            self.hits[k] = np.array(list(extend_list(notes, steps))) == "!"
+
+        self.key: Tuple = (self.sounds, self.steps, self.accents.tobytes(), self.hits.tobytes())
+
+    def __str__(self):
+        return f"{self.__class__.__name__} {self.name} steps={self.steps} sounds={self.sounds}"
+
+
+if __name__ == "__main__":
+    pass
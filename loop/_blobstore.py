@@ -0,0 +1,64 @@
+import hashlib
+import os
+from pathlib import Path
+from threading import get_ident
+from typing import Set
+
+import numpy as np
+
+from utils import always_true, find_chunk_stats
+
+
+class BlobStore:
+    """Loop buffers of all songs are kept once in directory, file name is hash of content.
+    Songs refer to buffers by hash, so unchanged or shared loops are not written again"""
+
+    def __init__(self, dir_name: Path):
+        self.__dir_name: Path = dir_name
+
+    def get_path(self, content_hash: str) -> Path:
+        """buffer is in .npy file of this path and chunk stats are in .stats.npy file"""
+        return Path(self.__dir_name, content_hash)
+
+    def has(self, content_hash: str) -> bool:
+        return content_hash != "" and os.path.isfile(self.get_path(content_hash).with_suffix(".stats.npy"))
+
+    @staticmethod
+    def make_hash(buff: np.ndarray) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{buff.dtype.str}{buff.shape}".encode())
+        digest.update(np.ascontiguousarray(buff).data)
+        return digest.hexdigest()
+
+    def put(self, buff: np.ndarray) -> str:
+        """returns hash of buffer, files are written only if they are missing.
+        Stats file is renamed last, so buffer with stats file is complete"""
+        content_hash = BlobStore.make_hash(buff)
+        if self.has(content_hash):
+            return content_hash
+
+        self.__dir_name.mkdir(parents=True, exist_ok=True)
+        path = self.get_path(content_hash)
+        for suffix, data in [(".npy", buff), (".stats.npy", np.stack(find_chunk_stats(buff)))]:
+            tmp_name = f"{path.with_suffix(suffix)}.{os.getpid()}-{get_ident()}.tmp"  # buffer may be put by many
+            with open(tmp_name, "wb") as f:
+                np.save(f, data)
+            os.replace(tmp_name, path.with_suffix(suffix))
+        return content_hash
+
+    def collect_garbage(self, used: Set[str]) -> int:
+        """delete buffers not used by any song, returns count of deleted buffers.
+        Buffers mapped from deleted files stay readable"""
+        if not os.path.isdir(self.__dir_name):
+            return 0
+        count = 0
+        for entry in os.scandir(self.__dir_name):
+            if entry.name.split(".")[0] not in used:
+                os.remove(entry.path)
+                count += entry.name.endswith(".stats.npy")
+        assert always_true(f"Deleted unused loop buffers {count}")
+        return count
+
+
+if __name__ == "__main__":
+    pass
@@ -18,10 +18,11 @@ class ExtendedCtrl(LooperCtrl):
     __mixer: Mixer = Mixer()
 
     def __init__(self, scr_conn: Connection):
-        LooperCtrl.__init__(self)
+        # song saved in background may redraw while looper is created
         self.__update_method: str = ""
         self.__description: str = ""
         self.__scr_conn: Connection = scr_conn
+        LooperCtrl.__init__(self)
 
     def _redraw(self) -> None:
         if self.__update_method:
@@ -99,11 +100,14 @@ class ExtendedCtrl(LooperCtrl):
 
     def _show_song_now(self) -> str:
         ff = self._file_finder
-        return ff.get_item_now()
+        return f"{ff.get_item_now()} {self._get_save_status()}"
 
     def _show_song_next(self) -> str:
         ff = self._file_finder
-        return ff.get_item_next()
+        return f"{ff.get_item_next()} {self._library.info_str(ff.get_item_next())}"
+
+    def _show_set_list(self) -> str:
+        return self._set_list.show()
 
     def _show_drum_type(self) -> str:
         return self._drum.show_drum_type()
@@ -169,6 +173,7 @@ class ExtendedCtrl(LooperCtrl):
             self.next = self.now
             self._stop_never()
 
+            self._wait_parts(tmp)
             part = self.items[tmp]
             if not part.is_empty:
                 self.items[tmp] = SongPart(self)
@@ -179,6 +184,7 @@ class ExtendedCtrl(LooperCtrl):
         part = self.get_item_now()
         if part.is_empty:
             return
+        self._wait_parts()
         for x in self.items:
             if x.is_empty:
                 x.items = copy.deepcopy(part.items)
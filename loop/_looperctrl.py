@@ -1,18 +1,37 @@
+import logging
+import traceback
 from threading import Thread, Event
+from typing import Union, List, Any, Tuple
+
+import numpy as np
+import sounddevice as sd
 
 from drum import RealDrum, FakeDrum
 from loop._loopsimple import LoopWithDrum
 from loop._oneloopctrl import OneLoopCtrl
 from loop._song import Song
-from utils import MsgProcessor, MAX_LEN
+from loop._songpart import SongPart
+from loop._undobudget import UndoBudget
+from utils import MsgProcessor, MAX_LEN, MixBus, MainLoader, ConfigName
 
 
 class LooperCtrl(OneLoopCtrl, Song, MsgProcessor):
     """added playback thread, MsgProcessor and Song.
-     Song is collection of song parts with related methods"""
+     Song is collection of song parts with related methods.
+     One audio stream is kept open, song parts are changed inside its callback"""
 
     def __init__(self):
         self._go_play = Event()
+        self.__part: Union[SongPart, None] = None  # part played by the stream, None if stopped
+        self.__part_changed: Event = Event()
+        self.__trim: Union[Tuple[SongPart, int], None] = None  # recorded part and its length, trimmed by thread
+        # song prepared to be swapped in at bar boundary: name, parts, first part, drum and its set
+        self.__next_song: Union[Tuple[str, List[SongPart], int, FakeDrum, Any], None] = None
+        self.__swapped_name: str = ""  # song swapped in by callback, it is selected by playback thread
+        self.__bus: MixBus = MixBus()
+        self.__budget: UndoBudget = UndoBudget(MainLoader.get(ConfigName.undo_memory_mb, 256),
+                                               MainLoader.get(ConfigName.undo_spill, False),
+                                               MainLoader.get(ConfigName.undo_spill_dir, ""))
         OneLoopCtrl.__init__(self)
         MsgProcessor.__init__(self)
         Song.__init__(self)
@@ -28,20 +47,100 @@ class LooperCtrl(OneLoopCtrl, Song, MsgProcessor):
         """used by children to _redraw itself on screen"""
         pass
 
+    def process_message(self, msg: List[Any]) -> None:
+        """stems and undo budget are updated after each message, errors are logged as in message handlers"""
+        super().process_message(msg)
+        try:
+            self._update_stems()
+            self.__budget.enforce(self.items)
+        except Exception as err:
+            logging.error(f"{self.__class__.__name__} after message: {msg}, "
+                          f"got error: {err}, info: {traceback.format_exc()}")
+
+    def _update_stems(self) -> None:
+        for part in self.items:
+            part.update_stem()
+
     def __playback(self) -> None:
-        """runs in a thread, play and record current song part"""
-        while True:
-            self._go_play.wait()
-            if self.next != self.now:
-                self.now = self.next
+        """runs in a thread, keeps audio stream open and redraws when song part changes"""
+        with sd.Stream(callback=self.__callback):
+            while True:
+                self.__part_changed.wait()
+                self.__part_changed.clear()
+                self.__on_part_changed()
+                self._update_stems()
+                self._redraw()
 
-            part = self.get_item_now()
-            self.get_stop_event().clear()
-            self._stop_never()
-            self.idx = 0
-            self._is_rec = part.is_empty
-            self._redraw()
-            part.play_buffer()
+    # noinspection PyUnusedLocal
+    def __callback(self, in_data: np.ndarray, out_data: np.ndarray, frame_count: int, time_info, status) -> None:
+        """play and record current song part, block is split if part stops inside of it"""
+        assert len(out_data) == len(in_data) == frame_count
+        mix = self.__bus.get_block(frame_count)
+        pos = 0
+        while pos < frame_count:
+            if self.__part is None:
+                if not self._go_play.is_set():
+                    break
+                self.__start_part()
+
+            end = min(frame_count, pos + self.get_stop_len() - self.idx)
+            if self.get_stop_event().is_set() or end <= pos:
+                self.__finish_part()
+                continue
+
+            self.__part.play_samples(mix[pos:end], self.idx)
+            if self.is_rec:
+                self.__part.record_samples(in_data[pos:end], self.idx)
+
+            self.idx += end - pos
+            pos = end
+            if self.idx >= self.get_stop_len():
+                self.stop_now()
+
+        MixBus.clip_into(mix, out_data)
+
+    def __start_part(self) -> None:
+        if self.__next_song is not None:
+            name, parts, first, drum, drum_set = self.__next_song
+            self.items = parts
+            self.now = self.next = first
+            self._drum = drum
+            drum.use_set(drum_set)
+            self.__next_song = None
+            self.__swapped_name = name
+
+        if self.next != self.now:
+            self.now = self.next
+
+        self.__part = self.get_item_now()
+        self.get_stop_event().clear()
+        self._stop_never()
+        self.idx = 0
+        self._is_rec = self.__part.is_empty and (self.__trim is None or self.__trim[0] is not self.__part)
+        self.__part_changed.set()
+
+    def __finish_part(self) -> None:
+        """First recording of part is trimmed by playback thread. Until it is done recorded buffer
+        is played from its start, it is the same as start of trimmed buffer"""
+        if self.__part.is_empty and self.idx > 0 and self.__trim is None:
+            self.__trim = (self.__part, self.idx)
+            self.__part_changed.set()
+        self.__part = None
+
+    def __on_part_changed(self) -> None:
+        """work that is too slow for the stream callback. Trim copies buffer and prepares drums,
+        song swapped in is selected in song list"""
+        if self.__swapped_name:
+            self._use_song_name(self.__swapped_name)
+            self.__swapped_name = ""
+        if self.__trim is not None:
+            part, idx = self.__trim
+            try:
+                part.trim_buffer(idx)
+            except (AssertionError, ValueError) as err:
+                logging.error(f"Failed to trim recorded part: {err}")
+            finally:
+                self.__trim = None
 
     def __stop_quantized(self) -> None:
         """the method for quantized playback and recording,
@@ -63,9 +162,10 @@ class LooperCtrl(OneLoopCtrl, Song, MsgProcessor):
                 self._stop_never()
 
     def _set_drum_length(self, length: int) -> None:
+        """drum of previous song is kept, its patterns are prepared for new length"""
         if length <= 0:
             self._drum = FakeDrum()
-        else:
+        elif not isinstance(self._drum, RealDrum):
             self._drum = RealDrum()
         self._drum.prepare_drum(length)
 
@@ -77,6 +177,29 @@ class LooperCtrl(OneLoopCtrl, Song, MsgProcessor):
         self.items.clear()
         self._drum.clear()
 
+    def _swap_song(self, name: str, length: int, parts: List[SongPart]) -> None:
+        """Stopped song is replaced now, played song at the end of its bar. Drums for new song
+        are prepared here, callback only swaps parts and drums without stopping the stream"""
+        if not self._go_play.is_set():
+            self._use_song(name, length, parts)
+            return
+
+        if length <= 0:
+            drum = FakeDrum()
+        elif isinstance(self._drum, RealDrum):
+            drum = self._drum
+        else:
+            drum = RealDrum()
+        self.__next_song = (name, parts, Song._first_part(parts), drum, drum.prepare_set(length))
+        self._is_rec = False
+        part = self.get_item_now()
+        if not self._drum.is_empty:
+            self._stop_at_bound(self._drum.length)
+        elif not part.is_empty:
+            self._stop_at_bound(part.length)
+        else:
+            self.stop_now()
+
     def _stop_song(self, wait: int = 0):
         self._is_rec = False
         self._go_play.clear()
@@ -109,6 +232,7 @@ class LooperCtrl(OneLoopCtrl, Song, MsgProcessor):
                 loop.resize_buff(MAX_LEN)
 
     def _play_part_id(self, part_id: int) -> None:
+        self._wait_parts(part_id)
         prev = self.next
         self.next = part_id
 
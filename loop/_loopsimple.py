@@ -68,13 +68,13 @@ class LoopWithDrum(LoopSimple):
             self.finalize(idx, self._ctrl.drum.length)
 
     def __getstate__(self):
-        state = self.__dict__.copy()
+        state = super().__getstate__()
         # Don't pickle some fields
         del state["_ctrl"]
         return state
 
     def __setstate__(self, state):
-        self.__dict__.update(state)
+        super().__setstate__(state)
         # Add _ctrl missing in the pickle
         self._ctrl = None
 
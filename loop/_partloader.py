@@ -0,0 +1,83 @@
+import logging
+from pathlib import Path
+from threading import Thread, Condition
+from typing import List, Dict, Set
+
+from loop._oneloopctrl import OneLoopCtrl
+from loop._songfile import SongFile
+from loop._songpart import SongPart
+from utils import always_true
+
+
+class PartLoader:
+    """Only the first part of song directory is loaded at once, other parts are loaded in background
+    thread. Until part is loaded it is empty part in the list, part waited for is loaded next"""
+
+    def __init__(self, path: Path, ctrl: OneLoopCtrl, first: int):
+        manifest = SongFile.read_manifest(path)
+        self.drum_length: int = manifest["drum_length"]
+        self.parts: List[SongPart] = [SongPart(ctrl) for _ in manifest["parts"]]
+        self.__path: Path = path
+        self.__ctrl: OneLoopCtrl = ctrl
+        self.__items: List = manifest["parts"]
+        history = SongFile.read_history(path)
+        self.__history: List = history["parts"] if history else [None] * len(self.__items)
+        self.__empty: Dict[int, SongPart] = {k: self.parts[k] for k, x in enumerate(self.__items) if x is not None}
+        self.__todo: List[int] = list(self.__empty)
+        self.__done: Set[int] = set()
+        self.__cond: Condition = Condition()
+        self.__is_cancelled: bool = False
+
+        if first in self.__todo:
+            self.__todo.remove(first)
+            self.__load(first)
+        Thread(target=self.__run, name="part_loader", daemon=True).start()
+
+    def wait(self, part_id: int) -> None:
+        """part is loaded next if it is not loaded yet"""
+        if part_id not in self.__empty:
+            return
+        with self.__cond:
+            if part_id in self.__todo:
+                self.__todo.remove(part_id)
+                self.__todo.insert(0, part_id)
+            while part_id not in self.__done and not self.__is_cancelled:
+                self.__cond.wait()
+
+    def wait_all(self) -> None:
+        for part_id in list(self.__empty):
+            self.wait(part_id)
+
+    def cancel(self) -> None:
+        """another song is loaded, parts not loaded yet are not needed"""
+        with self.__cond:
+            self.__is_cancelled = True
+            self.__todo.clear()
+            self.__cond.notify_all()
+
+    def __run(self) -> None:
+        while True:
+            with self.__cond:
+                if not self.__todo:
+                    assert always_true(f"Loaded parts {len(self.__done)} of {self.__path}")
+                    return
+                part_id = self.__todo.pop(0)
+            self.__load(part_id)
+
+    def __load(self, part_id: int) -> None:
+        """part replaces its empty part unless the song changed that part meanwhile"""
+        try:
+            part = SongFile.load_part(self.__path, self.__items[part_id], self.__ctrl, self.__history[part_id])
+        except (OSError, ValueError, KeyError) as err:
+            logging.error(f"Failed to load part {part_id} of {self.__path}: {err}")
+            part = self.__empty[part_id]
+
+        with self.__cond:
+            if part_id < len(self.parts) and self.parts[part_id] is self.__empty[part_id]:
+                self.parts[part_id] = part
+            self.__done.add(part_id)
+            self.__cond.notify_all()
+
+
+if __name__ == "__main__":
+    pass
@@ -4,7 +4,7 @@ import numpy as np
 import sounddevice as sd
 
 from loop._oneloopctrl import OneLoopCtrl
-from utils import always_true
+from utils import always_true, MixBus
 
 
 class Player:
@@ -15,13 +15,15 @@ class Player:
 
     def play_buffer(self):
         assert always_true(f"======Start {self}")
+        bus = MixBus()
 
         # noinspection PyUnusedLocal
         def callback(in_data, out_data, frame_count, time_info, status):
 
-            out_data[:] = 0
             assert len(out_data) == len(in_data) == frame_count
-            self.play_samples(out_data, self._ctrl.idx)
+            mix = bus.get_block(frame_count)
+            self.play_samples(mix, self._ctrl.idx)
+            MixBus.clip_into(mix, out_data)
 
             if self._ctrl.is_rec:
                 self.record_samples(in_data, self._ctrl.idx)
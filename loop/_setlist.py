@@ -0,0 +1,87 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, Future
+from pathlib import Path
+from typing import List, Dict, Tuple, Union
+
+from drum import RealDrum
+from loop._oneloopctrl import OneLoopCtrl
+from loop._songfile import SongFile
+from loop._songpart import SongPart
+from utils import JsonDictLoader, always_true
+
+LoadedSong = Tuple[int, List[SongPart]]
+
+
+class SetList:
+    """Ordered songs of a gig from JSON file with "songs" list and "preload" count.
+    Next songs are loaded by worker thread while song plays, loops are mapped
+    and read and drums for their bar length are rendered"""
+
+    def __init__(self, dir_name: Path, file_name: str, ctrl: OneLoopCtrl):
+        self.__dir_name: Path = dir_name
+        self.__ctrl: OneLoopCtrl = ctrl
+        self.songs: List[str] = []
+        self.preload: int = 1
+        self.pos: int = -1  # position of song played now, -1 before first song
+        try:
+            loader = JsonDictLoader(file_name)
+            self.songs = [str(x) for x in loader.get("songs", [])]
+            self.preload = max(0, int(loader.get("preload", 1)))
+        except (OSError, ValueError, RuntimeError) as err:
+            logging.info(f"No set list {file_name}: {err}")
+        self.__executor: ThreadPoolExecutor = ThreadPoolExecutor(1, "set_list")
+        self.__loaded: Dict[int, Future] = dict()
+        self.__preload_next()
+
+    @property
+    def is_empty(self) -> bool:
+        return len(self.songs) == 0
+
+    def step(self, go_fwd: bool) -> Tuple[str, Union[LoadedSong, None]]:
+        """move to next or previous song, returns its name and loaded song, None if it failed.
+        Song that is not preloaded is loaded now"""
+        if self.is_empty:
+            return "", None
+        self.pos = (self.pos + (1 if go_fwd else -1)) % len(self.songs)
+        future = self.__loaded.pop(self.pos, None)
+        if future is None:
+            future = self.__executor.submit(self.__load, self.songs[self.pos])
+        self.__preload_next()
+        return self.songs[self.pos], future.result()
+
+    def show(self) -> str:
+        if self.is_empty:
+            return "no set list"
+        k = self.pos + 1
+        name = self.songs[k % len(self.songs)]
+        return f"{k % len(self.songs) + 1}/{len(self.songs)} {name}"
+
+    def __preload_next(self) -> None:
+        """songs out of preload window are not kept"""
+        wanted = [(self.pos + k) % len(self.songs) for k in range(1, self.preload + 1)] if self.songs else []
+        for k in [x for x in self.__loaded if x not in wanted]:
+            self.__loaded.pop(k).cancel()
+        for k in [x for x in wanted if x not in self.__loaded]:
+            self.__loaded[k] = self.__executor.submit(self.__load, self.songs[k])
+
+    def __load(self, name: str) -> Union[LoadedSong, None]:
+        path = Path(self.__dir_name, name)
+        # noinspection PyBroadException
+        try:
+            if SongFile.is_song_dir(path):
+                length, parts = SongFile.load(path, self.__ctrl)
+            else:
+                length, parts = SongFile.load_pickle(path, self.__ctrl)
+        except Exception as err:
+            logging.error(f"Failed to preload song {path}: {err}")
+            return None
+
+        for loop in [x for part in parts for x in part.items]:
+            loop.read_pages()
+        RealDrum.warm_up(length)
+        assert always_true(f"Preloaded song {path}")
+        return length, parts
+
+
+if __name__ == "__main__":
+    pass
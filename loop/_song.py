@@ -1,19 +1,35 @@
 import os
-import pickle
+import shutil
 from abc import abstractmethod
 from datetime import datetime
+from typing import List, Union
 
 from loop._oneloopctrl import OneLoopCtrl
+from loop._partloader import PartLoader
+from loop._setlist import SetList
+from loop._songfile import SongFile
 from loop._songpart import SongPart
-from utils import CollectionOwner, FileFinder, always_true
+from loop._songlibrary import SongLibrary
+from loop._songsaver import SongSaver
+from utils import CollectionOwner, FileFinder, always_true, MainLoader, ConfigName
 
 
 class Song(CollectionOwner[SongPart]):
-    """Song keeps SongParts as CollectionOwner, can save and load from file"""
+    """Song keeps SongParts as CollectionOwner, can save and load from file.
+    Songs are saved as directories of SongFile, older pickled songs are still loaded"""
+
+    save_dir: str = "save_song"  # relative to root directory of looper
 
     def __init__(self):
         super().__init__()
-        self._file_finder: FileFinder = FileFinder("save_song", True, ".sng", "")
+        self.__part_loader: Union[PartLoader, None] = None  # loads parts of song in background
+        self.__saver: SongSaver = SongSaver(self.__on_save_status)
+        self._file_finder: FileFinder = FileFinder(Song.save_dir, None, ".sng", "")
+        self._library: SongLibrary = SongLibrary(self._file_finder.get_dir_name(), ".sng")
+        self._library.refresh_later()
+        self._set_list: SetList = SetList(self._file_finder.get_dir_name(),
+                                          MainLoader.get(ConfigName.set_list, "etc/set_list.json"),
+                                          self._get_control())
         self._song_name = ""
         self.__set_song_name()
 
@@ -37,31 +53,78 @@ class Song(CollectionOwner[SongPart]):
     def _get_control(self) -> OneLoopCtrl:
         pass
 
+    @abstractmethod
+    def _redraw(self) -> None:
+        pass
+
+    @abstractmethod
+    def _swap_song(self, name: str, length: int, parts: List[SongPart]) -> None:
+        pass
+
     def _load_song(self) -> None:
         self._stop_song()
+        self.__saver.wait()
+        self.__saver.status = ""
         self._file_finder.now = self._file_finder.next
         full_name = self._file_finder.get_path_now()
         assert always_true(f"Loading song file {full_name}")
-        with open(full_name, 'rb') as f:
-            length, load_list = pickle.load(f)
-
-        self.items.clear()
-        ctrl = self._get_control()
-        for k in load_list:
-            if k is None:
-                k = SongPart(ctrl)
-            else:
-                assert type(k) == SongPart
-                k._ctrl = ctrl
-                for b in [*k.items, *k.backup]:
-                    b._ctrl = ctrl
-
-            self.items.append(k)
+        if self.__part_loader is not None:
+            self.__part_loader.cancel()
+            self.__part_loader = None
+
+        if not SongFile.is_song_dir(full_name):
+            length, load_list = SongFile.load_pickle(full_name, self._get_control())
+        elif MainLoader.get(ConfigName.song_lazy_load, True):
+            self.__part_loader = PartLoader(full_name, self._get_control(), self.now)
+            length, load_list = self.__part_loader.drum_length, self.__part_loader.parts
+        else:
+            length, load_list = SongFile.load(full_name, self._get_control())
+
+        self.items = load_list
+        self._set_drum_length(length)
 
+    def _change_set_song(self, *params) -> None:
+        """next song of set list is already loaded, it replaces played song at bar boundary"""
+        name, song = self._set_list.step(go_fwd=params[0] > 0)
+        if song is not None:
+            self._swap_song(name, *song)
+        self._redraw()
+
+    def _use_song(self, name: str, length: int, parts: List[SongPart]) -> None:
+        """loaded song replaces stopped song"""
+        self.items = parts
+        self.now = self.next = Song._first_part(parts)
+        self._use_song_name(name)
         self._set_drum_length(length)
 
+    @staticmethod
+    def _first_part(parts: List[SongPart]) -> int:
+        """first part with loops is played first"""
+        return next((k for k, x in enumerate(parts) if not x.is_empty), 0)
+
+    def _use_song_name(self, name: str) -> None:
+        """song that replaced parts of previous song is selected in song list"""
+        if self.__part_loader is not None:
+            self.__part_loader.cancel()
+            self.__part_loader = None
+        self.__saver.status = ""
+        if name not in self._file_finder.items:
+            self._file_finder.items.append(name)
+        self._file_finder.now = self._file_finder.next = self._file_finder.items.index(name)
+        self._song_name = name
+
+    def _wait_parts(self, *part_ids: int) -> None:
+        """parts of song loaded in background must be loaded before they are changed"""
+        if self.__part_loader is not None:
+            for part_id in part_ids if part_ids else range(self.items_len):
+                self.__part_loader.wait(part_id)
+
     def _save_song(self) -> None:
-        self._stop_song()
+        """With SONG_SAVE_BACKGROUND song is saved while it plays, otherwise it is stopped and saved"""
+        is_background = MainLoader.get(ConfigName.song_save_background, True)
+        if not is_background:
+            self._stop_song()
+        self._wait_parts()
         length = self._get_drum_length()
         save_list = []
         for k in self.items:
@@ -69,8 +132,18 @@ class Song(CollectionOwner[SongPart]):
 
         full_name = self._file_finder.get_path_now()
         assert always_true(f"Saving song file {full_name}")
-        with open(full_name, 'wb') as f:
-            pickle.dump((length, save_list), f)
+        self.__saver.save(full_name, length, save_list, MainLoader.get(ConfigName.song_save_history, True))
+        if not is_background:
+            self.__saver.wait()
+
+    def _get_save_status(self) -> str:
+        return self.__saver.status
+
+    def __on_save_status(self) -> None:
+        """saved song is read into library by its thread"""
+        if self.__saver.status == "saved":
+            self._library.refresh_later()
+        self._redraw()
 
     def _save_new_song(self):
         self._song_name = self.__new_song_name()
@@ -80,9 +153,14 @@ class Song(CollectionOwner[SongPart]):
 
     def _delete_song(self) -> None:
         self._stop_song()
+        self.__saver.wait()
         path = self._file_finder.get_path_now()
-        if os.path.isfile(path):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.isfile(path):
             os.remove(path)
+        self.__saver.collect_garbage(self._file_finder.get_dir_name())
+        self._library.refresh_later()
         self._file_finder.items.pop(self._file_finder.now)
         self._file_finder.now = self._file_finder.next = 0
         self.__set_song_name()
@@ -0,0 +1,96 @@
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Union
+
+import numpy as np
+
+from drum import FakeDrum
+from loop._oneloopctrl import OneLoopCtrl
+from loop._songfile import SongFile
+from loop._songpart import SongPart
+
+_control: Union[OneLoopCtrl, None] = None  # control of loops in worker process
+
+
+class SongConverter:
+    """class will only static methods. Songs saved by older version as one pickle file are
+    converted to SongFile directories. Song is written next to pickle file, checked and renamed,
+    pickle file is moved to backup directory. Conversion that was interrupted is finished next time"""
+
+    tmp_end: str = ".converting"
+
+    @staticmethod
+    def find_legacy(dir_name: Path, end_with: str) -> List[Path]:
+        """pickled songs and songs with unfinished conversion"""
+        with os.scandir(dir_name) as entries:
+            names = [x.name for x in entries]
+        result = [Path(dir_name, x) for x in names if x.endswith(end_with) and os.path.isfile(Path(dir_name, x))]
+        for x in [x for x in names if x.endswith(end_with + SongConverter.tmp_end)]:
+            path = Path(dir_name, x[:-len(SongConverter.tmp_end)])
+            if path not in result and not os.path.exists(path):
+                result.append(path)
+        return sorted(result)
+
+    @staticmethod
+    def convert(path: Path, backup_dir: Path) -> Dict[str, Any]:
+        """returns report of one song: name, status, seconds, bytes before and after"""
+        start = time.perf_counter()
+        tmp_path = Path(str(path) + SongConverter.tmp_end)
+        backup = Path(backup_dir, path.name)
+        report = {"name": path.name, "status": "converted", "before": 0, "after": 0, "seconds": 0.0}
+
+        if os.path.isfile(path):
+            if os.path.isdir(tmp_path):
+                shutil.rmtree(tmp_path)
+            report["before"] = os.path.getsize(path)
+            length, parts = SongFile.load_pickle(path, SongConverter.__get_control())
+            SongFile.save(tmp_path, length, [x if not x.is_empty else None for x in parts])
+            SongConverter.verify(tmp_path, length, parts)
+            backup_dir.mkdir(parents=True, exist_ok=True)
+            os.replace(path, backup)
+        elif SongFile.is_song_dir(tmp_path) and os.path.isfile(backup):
+            report["status"] = "resumed"
+            report["before"] = os.path.getsize(backup)
+        else:
+            raise ValueError(f"Song {path} is not a pickle file and has no finished conversion")
+
+        os.rename(tmp_path, path)
+        report["after"] = SongConverter.song_bytes(path)
+        report["seconds"] = time.perf_counter() - start
+        return report
+
+    @staticmethod
+    def verify(path: Path, drum_length: int, parts: List[SongPart]) -> None:
+        """song directory must have the same samples and flags as song it was made from"""
+        length, loaded = SongFile.load(path, SongConverter.__get_control())
+        if length != drum_length or len(loaded) != len(parts):
+            raise ValueError(f"Song {path} differs in drum length or count of parts")
+        for k, (part, other) in enumerate(zip(parts, loaded)):
+            loops = [x for x in part.items if not x.is_empty] if not part.is_empty else []
+            if len(loops) != len([x for x in other.items if not x.is_empty]):
+                raise ValueError(f"Song {path} differs in count of loops in part {k}")
+            for x, y in zip(loops, other.items):
+                if (x.is_reverse, x.is_silent) != (y.is_reverse, y.is_silent) \
+                        or not np.array_equal(x.get_buff_copy(), y.get_buff_copy()):
+                    raise ValueError(f"Song {path} differs in loop of part {k}")
+
+    @staticmethod
+    def song_bytes(path: Path) -> int:
+        """size of song directory and loop buffers used by it, shared buffers are counted too"""
+        store = SongFile.get_store(path)
+        files = [store.get_path(x).with_suffix(y) for x in SongFile.used_blobs(path) for y in [".npy", ".stats.npy"]]
+        return sum(os.path.getsize(x) for x in [*Path(path).iterdir(), *files] if os.path.isfile(x))
+
+    @staticmethod
+    def __get_control() -> OneLoopCtrl:
+        global _control
+        if _control is None:
+            _control = OneLoopCtrl()
+            _control._drum = FakeDrum()
+        return _control
+
+
+if __name__ == "__main__":
+    pass
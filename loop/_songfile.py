@@ -0,0 +1,242 @@
+import json
+import os
+import pickle
+import shutil
+from pathlib import Path
+from typing import List, Tuple, Union, Dict, Any, Callable, Set
+
+from loop._blobstore import BlobStore
+from loop._loopsimple import LoopWithDrum
+from loop._oneloopctrl import OneLoopCtrl
+from loop._songhistory import SongHistory, HistoryRef
+from loop._songpart import SongPart
+from loop._undoentry import UndoEntry
+from utils import always_true
+
+# manifest, history sidecar and loops with their manifest items, snapshots and history
+SongSnapshot = Tuple[Dict[str, Any], Union[Dict[str, Any], None],
+                     List[Tuple[Dict[str, Any], Union[Dict[str, Any], None], LoopWithDrum, UndoEntry, Any]]]
+
+
+class SongFile:
+    """class will only static methods. Song is saved as directory with song.json manifest,
+    loop buffers are in BlobStore shared by all songs. Buffers are memory mapped when song is loaded,
+    so opening a song does not copy audio and does not depend on layout of classes.
+    Undo history and deleted loops are in optional history.json sidecar loaded on first undo.
+    Songs of format 1 kept .npy files of loops in song directory"""
+
+    format_version: int = 2
+    manifest: str = "song.json"
+    blob_dir: str = ".blobs"
+    tmp_end: str = ".saving"
+
+    @staticmethod
+    def get_store(path: Path) -> BlobStore:
+        """store of directory that keeps the song"""
+        return BlobStore(Path(Path(path).parent, SongFile.blob_dir))
+
+    @staticmethod
+    def is_song_dir(path: Path) -> bool:
+        return os.path.isfile(Path(path, SongFile.manifest))
+
+    @staticmethod
+    def snapshot(drum_length: int, parts: List[Union[SongPart, None]], with_history: bool = True) -> SongSnapshot:
+        """Manifest and loop snapshots of song, song may be played and changed while it is written.
+        Loop recorded for the first time is not saved. History of loops and deleted loops
+        go to sidecar if it is saved, otherwise history not loaded yet is loaded now"""
+        manifest = {"version": SongFile.format_version, "drum_length": drum_length, "parts": []}
+        history = {"parts": []} if with_history else None
+        loops_to_write = []
+
+        def add_loop(target: List, hist_target: Union[List, None], loop: LoopWithDrum) -> None:
+            target.append({"blob": "", "length": loop.length, "is_reverse": loop.is_reverse,
+                           "is_silent": loop.is_silent})
+            if hist_target is None:
+                loops_to_write.append((target[-1], None, loop, loop.take_snapshot(), None))
+                return
+            if hist_target is not target:
+                hist_target.append(dict())
+            loops_to_write.append((target[-1], hist_target[-1], loop, loop.take_snapshot(), loop.history_state()))
+
+        for part in parts:
+            if part is None:
+                manifest["parts"].append(None)
+                history and history["parts"].append(None)
+                continue
+            loops, hist_loops, backup = [], [] if with_history else None, []
+            if not with_history:
+                for loop in [*part.items, *part.backup]:
+                    loop.load_history()
+            for loop in [x for x in part.items if not x.is_empty]:
+                add_loop(loops, hist_loops, loop)
+            manifest["parts"].append({"now": min(part.now, len(loops) - 1), "next": min(part.next, len(loops) - 1),
+                                      "loops": loops})
+            if with_history:
+                for loop in [x for x in part.backup if not x.is_empty]:
+                    add_loop(backup, backup, loop)
+                history["parts"].append({"loops": hist_loops, "backup": backup})
+        return manifest, history, loops_to_write
+
+    @staticmethod
+    def write(path: Path, snapshot: SongSnapshot, progress: Callable[[int, int], None] = None) -> None:
+        """Only loops missing in store are written, loop keeps hash of its content until it changes.
+        Manifest is replaced at once, files of format 1 are deleted after it. Buffers mapped
+        from them stay readable. Song saved as pickle file is replaced by directory written
+        under temporary name, pickle is removed last. Progress gets count of done loops"""
+        manifest, history, loops_to_write = snapshot
+        store = SongFile.get_store(path)
+        written = 0
+        try:
+            for k, (info, hist_info, loop, entry, state) in enumerate(loops_to_write):
+                content_hash = loop.snapshot_hash(entry)
+                buff = None
+                if not store.has(content_hash):
+                    buff = loop.read_snapshot(entry)
+                    content_hash = store.put(buff)
+                    loop.set_snapshot_hash(entry, content_hash)
+                    written += 1
+                info["blob"] = content_hash
+                if hist_info is not None:
+                    if buff is None and any(x[1] is None for x in [*state[1][-1:], *state[2][-1:]]):
+                        buff = loop.read_snapshot(entry)
+                    hist_info.update(SongHistory.write_loop(store, buff, state))
+                if progress is not None:
+                    progress(k + 1, len(loops_to_write))
+        finally:
+            for _, _, loop, entry, _ in loops_to_write:
+                loop.drop_snapshot(entry)
+
+        is_pickle = os.path.isfile(path)
+        song_dir = Path(str(path) + SongFile.tmp_end) if is_pickle else Path(path)
+        if is_pickle and os.path.isdir(song_dir):
+            shutil.rmtree(song_dir)
+        song_dir.mkdir(parents=True, exist_ok=True)
+        names = [SongFile.manifest]
+        if history is not None:
+            SongFile.__write_json(Path(song_dir, SongHistory.file_name), history)
+            names.append(SongHistory.file_name)
+        SongFile.__write_json(Path(song_dir, SongFile.manifest), manifest)
+        for entry in os.scandir(song_dir):
+            if entry.name not in names:
+                os.remove(entry.path)
+        if is_pickle:
+            old_name = str(path) + ".old"
+            os.replace(path, old_name)
+            os.rename(song_dir, path)
+            os.remove(old_name)
+        assert always_true(f"Saved song {path} parts {len(manifest['parts'])} new loops {written}")
+
+    @staticmethod
+    def __write_json(path: Path, data: Dict[str, Any]) -> None:
+        tmp_name = str(path) + ".tmp"
+        with open(tmp_name, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_name, path)
+
+    @staticmethod
+    def used_blobs(path: Path) -> Set[str]:
+        """hashes of loop buffers and history used by song"""
+        used: Set[str] = set()
+        for item in [x for x in SongFile.read_manifest(path)["parts"] if x is not None]:
+            used.update(x.get("blob", "") for x in item["loops"])
+        history = SongFile.read_history(path)
+        for item in [x for x in history["parts"] if x is not None] if history else []:
+            for x in [*item["loops"], *item["backup"]]:
+                used.update([x.get("blob", ""), *SongHistory.used_blobs(x)])
+        used.discard("")
+        return used
+
+    @staticmethod
+    def collect_garbage(dir_name: Path) -> int:
+        """delete loop buffers not used by songs in directory and their history, returns count of deleted buffers"""
+        used: Set[str] = set()
+        for entry in os.scandir(dir_name):
+            if entry.is_dir() and SongFile.is_song_dir(Path(entry.path)):
+                used.update(SongFile.used_blobs(Path(entry.path)))
+        return BlobStore(Path(dir_name, SongFile.blob_dir)).collect_garbage(used)
+
+    @staticmethod
+    def save(path: Path, drum_length: int, parts: List[Union[SongPart, None]], with_history: bool = True) -> None:
+        SongFile.write(path, SongFile.snapshot(drum_length, parts, with_history))
+
+    @staticmethod
+    def read_manifest(path: Path) -> Dict[str, Any]:
+        with open(Path(path, SongFile.manifest)) as f:
+            manifest = json.load(f)
+        if manifest.get("version", 0) > SongFile.format_version:
+            raise ValueError(f"Song {path} has newer format {manifest['version']}")
+        return manifest
+
+    @staticmethod
+    def read_history(path: Path) -> Union[Dict[str, Any], None]:
+        """sidecar with history of loops and deleted loops, None if song has no sidecar"""
+        try:
+            with open(Path(path, SongHistory.file_name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def __read_loop(path: Path, info: Dict[str, Any], hist_info: Union[Dict[str, Any], None],
+                    loop: LoopWithDrum) -> LoopWithDrum:
+        store = SongFile.get_store(path)
+        if "blob" in info:
+            loop.read_files(store.get_path(info["blob"]), info["blob"])
+        else:
+            loop.read_files(Path(path, info["name"]))
+        loop.is_reverse = info["is_reverse"]
+        loop.is_silent = info["is_silent"]
+        if hist_info and (hist_info["undo"] or hist_info["redo"]):
+            loop.set_history(HistoryRef(store, hist_info["undo"], hist_info["redo"]))
+        return loop
+
+    @staticmethod
+    def load_part(path: Path, item: Union[Dict[str, Any], None], ctrl: OneLoopCtrl,
+                  hist_item: Union[Dict[str, Any], None] = None) -> SongPart:
+        """part from its manifest item, None item is new empty part. History is loaded by loop when it is used"""
+        part = SongPart(ctrl)
+        if item is None:
+            return part
+        hist_loops = hist_item["loops"] if hist_item else [None] * len(item["loops"])
+        for k, (info, hist_info) in enumerate(zip(item["loops"], hist_loops)):
+            loop = SongFile.__read_loop(path, info, hist_info, part.items[0] if k == 0 else LoopWithDrum(ctrl, 0))
+            if k > 0:
+                part.items.append(loop)
+        for info in hist_item["backup"] if hist_item else []:
+            part.backup.append(SongFile.__read_loop(path, info, info, LoopWithDrum(ctrl, 0)))
+        part.now = item["now"]
+        part.next = item["next"]
+        return part
+
+    @staticmethod
+    def load_pickle(path: Path, ctrl: OneLoopCtrl) -> Tuple[int, List[SongPart]]:
+        """song saved by older version as one pickle file"""
+        with open(path, 'rb') as f:
+            length, load_list = pickle.load(f)
+
+        parts = []
+        for k in load_list:
+            if k is None:
+                k = SongPart(ctrl)
+            else:
+                assert type(k) == SongPart
+                k._ctrl = ctrl
+                for b in [*k.items, *k.backup]:
+                    b._ctrl = ctrl
+
+            parts.append(k)
+        return length, parts
+
+    @staticmethod
+    def load(path: Path, ctrl: OneLoopCtrl) -> Tuple[int, List[SongPart]]:
+        """returns drum length and parts, parts that were empty are new empty parts"""
+        manifest = SongFile.read_manifest(path)
+        history = SongFile.read_history(path)
+        hist_parts = history["parts"] if history else [None] * len(manifest["parts"])
+        parts = [SongFile.load_part(path, x, ctrl, y) for x, y in zip(manifest["parts"], hist_parts)]
+        assert always_true(f"Loaded song {path} parts {len(parts)}")
+        return manifest["drum_length"], parts
+
+
+if __name__ == "__main__":
+    pass
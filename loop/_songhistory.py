@@ -0,0 +1,86 @@
+from typing import List, Tuple, Dict, Any, Union, Optional
+
+import numpy as np
+
+from loop._blobstore import BlobStore
+from loop._undoentry import UndoEntry
+from utils import CHUNK_LEN
+
+# length, full buffer or None, chunks of chunk entry
+EntryState = Tuple[int, Union[np.ndarray, None], Dict[int, Optional[np.ndarray]]]
+
+
+class HistoryRef:
+    """Undo and redo of saved loop that are not loaded yet. Loop loads them when history is used
+    first time. Entries next to loop state are saved full, so they do not depend on loop buffer"""
+
+    def __init__(self, store: BlobStore, undo: List[Dict[str, Any]], redo: List[Dict[str, Any]]):
+        self.store: BlobStore = store
+        self.undo: List[Dict[str, Any]] = undo
+        self.redo: List[Dict[str, Any]] = redo
+
+    def load(self) -> Tuple[List[UndoEntry], List[UndoEntry]]:
+        """arrays of entries are memory mapped read only"""
+        return [self.__load_entry(x) for x in self.undo], [self.__load_entry(x) for x in self.redo]
+
+    def __load_entry(self, item: Dict[str, Any]) -> UndoEntry:
+        path = self.store.get_path(item["blob"]).with_suffix(".npy")
+        if "chunks" not in item:
+            entry = UndoEntry(item["length"], np.load(path, mmap_mode='r'))
+            entry.is_spilled = True
+            return entry
+
+        entry = UndoEntry(item["length"])
+        data = np.load(path, mmap_mode='r') if item["blob"] else None
+        pos = 0
+        for k in item["chunks"]:
+            chunk_len = min(CHUNK_LEN, item["length"] - k * CHUNK_LEN)
+            entry.chunks[k] = data[pos:pos + chunk_len]
+            entry.spilled_chunks.add(k)
+            pos += chunk_len
+        for k in item["zero"]:
+            entry.chunks[k] = None
+        return entry
+
+
+class SongHistory:
+    """class will only static methods. History of loops is saved to optional sidecar of song,
+    arrays of entries are kept in BlobStore as loop buffers"""
+
+    file_name: str = "history.json"
+
+    @staticmethod
+    def write_loop(store: BlobStore, buff: np.ndarray,
+                   state: Tuple[Union[HistoryRef, None], List[EntryState], List[EntryState]]) -> Dict[str, Any]:
+        """History of loop from its snapshot, buff is loop state of the snapshot.
+        Entries next to this state are saved full"""
+        ref, undo, redo = state
+        items = {"undo": list(ref.undo) if ref else [], "redo": list(ref.redo) if ref else []}
+        for name, entries in [("undo", undo), ("redo", redo)]:
+            for k, (length, full, chunks) in enumerate(entries):
+                if full is None and k == len(entries) - 1:
+                    full = buff.copy()
+                    for n, chunk in chunks.items():
+                        full[n * CHUNK_LEN:(n + 1) * CHUNK_LEN] = 0 if chunk is None else chunk
+                items[name].append(SongHistory.__write_entry(store, length, full, chunks))
+        return items
+
+    @staticmethod
+    def __write_entry(store: BlobStore, length: int, full: Union[np.ndarray, None],
+                      chunks: Dict[int, Optional[np.ndarray]]) -> Dict[str, Any]:
+        if full is not None:
+            return {"length": length, "blob": store.put(full)}
+
+        used = sorted(k for k, x in chunks.items() if x is not None)
+        zero = sorted(k for k, x in chunks.items() if x is None)
+        blob = store.put(np.concatenate([chunks[k] for k in used])) if used else ""
+        return {"length": length, "blob": blob, "chunks": used, "zero": zero}
+
+    @staticmethod
+    def used_blobs(items: Dict[str, Any]) -> List[str]:
+        """hashes used by history of one loop"""
+        return [x["blob"] for x in [*items["undo"], *items["redo"]] if x["blob"]]
+
+
+if __name__ == "__main__":
+    pass
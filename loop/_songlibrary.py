@@ -0,0 +1,133 @@
+import json
+import logging
+import os
+import pickle
+from pathlib import Path
+from threading import Lock, Thread
+from typing import Dict, Any, Union, List
+
+import numpy as np
+
+from loop._songfile import SongFile
+from utils import always_true, SD_RATE
+
+
+class SongLibrary:
+    """Details of saved songs kept in index file of song directory. Index is updated
+    by refresh when song changes its mtime, so browsing songs does not read their audio.
+    Songs are read without lock, lock only guards the index"""
+
+    file_name: str = ".library.json"
+
+    def __init__(self, dir_name: Path, end_with: str):
+        self.__dir_name: Path = Path(dir_name)
+        self.__end_with: str = end_with
+        self.__lock: Lock = Lock()
+        self.__index: Dict[str, Dict[str, Any]] = dict()
+        try:
+            with open(Path(self.__dir_name, SongLibrary.file_name)) as f:
+                self.__index = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def refresh(self) -> List[str]:
+        """update index for all songs, returns names of songs sorted as in directory"""
+        with os.scandir(self.__dir_name) as entries:
+            found = [(x.name, x.stat().st_mtime_ns) for x in entries if x.name.endswith(self.__end_with)]
+        names = [x for x, _ in found]
+        is_changed = False
+        for name, mtime in found:
+            is_changed = self.__update(name, mtime) or is_changed
+        with self.__lock:
+            for name in [x for x in self.__index if x not in names]:
+                del self.__index[name]
+                is_changed = True
+            if is_changed:
+                self.__write()
+        assert always_true(f"Song library {self.__dir_name} songs {len(names)}")
+        return names
+
+    def refresh_later(self) -> None:
+        """control thread does not wait for songs to be read"""
+        Thread(target=self.refresh, name="song_library", daemon=True).start()
+
+    def get(self, name: str) -> Union[Dict[str, Any], None]:
+        """details of one song from index, None if song is not indexed yet. Song is not read here"""
+        with self.__lock:
+            return self.__index.get(name)
+
+    def info_str(self, name: str) -> str:
+        info = self.get(name)
+        if info is None:
+            return ""
+        minutes, seconds = divmod(round(info["duration"]), 60)
+        loops = "+".join(str(x) for x in info["loops"] if x)
+        return f"{minutes}:{seconds:02} {info['parts']}p {loops} {info['size'] / 1e6:.1f}MB"
+
+    def __update(self, name: str, mtime: int) -> bool:
+        """returns True if index changed, song is read only if its mtime changed"""
+        with self.__lock:
+            info = self.__index.get(name)
+        if info is not None and info["mtime"] == mtime:
+            return False
+        path = Path(self.__dir_name, name)
+        if os.path.isdir(path) and not SongFile.is_song_dir(path):
+            return False  # first save of song is not finished
+        try:
+            info = SongLibrary.__read_dir(path) if SongFile.is_song_dir(path) else SongLibrary.__read_pickle(path)
+        except (OSError, ValueError, KeyError, EOFError, pickle.UnpicklingError) as err:
+            logging.error(f"Failed to read song {path}: {err}")
+            with self.__lock:
+                self.__index.pop(name, None)
+            return False
+        info["mtime"] = mtime
+        with self.__lock:
+            self.__index[name] = info
+        return True
+
+    def __write(self) -> None:
+        tmp_name = str(Path(self.__dir_name, SongLibrary.file_name)) + ".tmp"
+        try:
+            with open(tmp_name, "w") as f:
+                json.dump(self.__index, f, indent=2)
+            os.replace(tmp_name, Path(self.__dir_name, SongLibrary.file_name))
+        except OSError as err:
+            logging.error(f"Failed to write song library {self.__dir_name}: {err}")
+
+    @staticmethod
+    def __make_info(drum_length: int, loop_lengths: List[List[int]], size: int) -> Dict[str, Any]:
+        """song plays longest loop of each part once"""
+        return {"drum_length": drum_length, "parts": sum(1 for x in loop_lengths if x),
+                "loops": [len(x) for x in loop_lengths], "size": size,
+                "duration": sum(max(x, default=0) for x in loop_lengths) / SD_RATE}
+
+    @staticmethod
+    def __read_dir(path: Path) -> Dict[str, Any]:
+        """lengths are in manifest, songs saved before it have them in headers of .npy files"""
+        manifest = SongFile.read_manifest(path)
+        store = SongFile.get_store(path)
+        loop_lengths = []
+        files = set()
+        for item in manifest["parts"]:
+            loop_lengths.append([])
+            for info in item["loops"] if item else []:
+                name = store.get_path(info["blob"]) if "blob" in info else Path(path, info["name"])
+                files.add(name.with_suffix(".npy"))
+                if "length" in info:
+                    loop_lengths[-1].append(info["length"])
+                else:
+                    loop_lengths[-1].append(len(np.load(name.with_suffix(".npy"), mmap_mode='r')))
+        size = sum(os.path.getsize(x) for x in files)
+        return SongLibrary.__make_info(manifest["drum_length"], loop_lengths, size)
+
+    @staticmethod
+    def __read_pickle(path: Path) -> Dict[str, Any]:
+        """song saved by older version is read once, then its details are in index"""
+        with open(path, 'rb') as f:
+            drum_length, parts = pickle.load(f)
+        loop_lengths = [[x.length for x in part.items if not x.is_empty] if part else [] for part in parts]
+        return SongLibrary.__make_info(drum_length, loop_lengths, os.path.getsize(path))
+
+
+if __name__ == "__main__":
+    pass
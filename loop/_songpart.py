@@ -1,4 +1,6 @@
-from threading import Timer
+from math import lcm
+from threading import Timer, Lock
+from typing import List, FrozenSet, Tuple, Union
 
 import numpy as np
 
@@ -6,17 +8,38 @@ from loop._loopsimple import LoopWithDrum
 from loop._oneloopctrl import OneLoopCtrl
 from loop._player import Player
 from loop._wrapbuffer import WrapBuffer
-from utils import CollectionOwner, ScrColors, always_true
-from utils import STATE_COLS
+from utils import CollectionOwner, ScrColors, always_true, play_sound_buff
+from utils import STATE_COLS, MAX_LEN, MIX_TYPE
 
 
 class SongPart(CollectionOwner[LoopWithDrum], Player):
-    """Loop that includes many more simple loops to play together"""
+    """Loop that includes many more simple loops to play together.
+    Idle loops are pre-mixed into a stem, so audio callback adds one buffer for them"""
 
     def __init__(self, ctrl: OneLoopCtrl):
         Player.__init__(self, ctrl)
         CollectionOwner.__init__(self)
         self.items.append(LoopWithDrum(ctrl))
+        self.__init_stem()
+
+    def __init_stem(self) -> None:
+        self.__lock: Lock = Lock()
+        self.__stem: Union[np.ndarray, None] = None
+        self.__stem_key: Tuple[FrozenSet[Tuple[int, int, bool]], int] = (frozenset(), 0)
+        self.__stem_loops: List[Tuple[LoopWithDrum, int, bool]] = []  # loop, version, is_reverse
+        self.__stem_ids: FrozenSet[int] = frozenset()
+
+    def __getstate__(self):
+        state = Player.__getstate__(self)
+        # Don't pickle stem, it is made again after loading
+        for name in ["_SongPart__lock", "_SongPart__stem", "_SongPart__stem_key", "_SongPart__stem_loops",
+                     "_SongPart__stem_ids"]:
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__init_stem()
 
     def trim_buffer(self, idx: int) -> None:
         """create drums of correct length if drum is empty,
@@ -32,15 +55,98 @@ class SongPart(CollectionOwner[LoopWithDrum], Player):
     def length(self) -> int:
         return self.items[0].length
 
+    def __heard_loops(self) -> List[LoopWithDrum]:
+        return [x for x in self.items if not x.is_silent and not x.is_empty]
+
+    def __rec_loop(self) -> Union[LoopWithDrum, None]:
+        return self.get_item_now() if self._ctrl and self._ctrl.is_rec else None
+
+    def __set_stem_loops(self, loops: List[LoopWithDrum]) -> None:
+        self.__stem_loops = [(x, x.version, x.is_reverse) for x in loops]
+        self.__stem_ids = frozenset(id(x) for x in loops)
+
+    def __is_stem_valid(self, heard: List[LoopWithDrum]) -> bool:
+        """stem matches loops if all its loops are heard and not changed,
+        loop in stem has dirty regions if it was recorded without adding to stem"""
+        heard_ids = set(id(x) for x in heard)
+        return all(x.version == version and x.is_reverse == is_reverse and id(x) in heard_ids and not x.has_dirty()
+                   for x, version, is_reverse in self.__stem_loops)
+
+    def update_stem(self) -> None:
+        """Runs outside of audio callback. Removes changed loops from stem and adds new loops,
+        only recorded regions of new loops are added. Stem is mixed again if loop content was replaced.
+        Audio callback plays loops one by one while stem is updated"""
+        with self.__lock:
+            heard = self.__heard_loops()
+            rec_loop = self.__rec_loop()
+            key = (frozenset((id(x), x.version, x.is_reverse) for x in heard), id(rec_loop))
+            if key == self.__stem_key and self.__is_stem_valid(heard):
+                return
+
+            is_full = self.__stem is None
+            is_full |= any(x.version != version or x.has_dirty() for x, version, _ in self.__stem_loops)
+            heard_ids = set(id(x) for x in heard)
+            removed = [x for x in self.__stem_loops if x[0].is_reverse != x[2] or id(x[0]) not in heard_ids]
+            kept = [x for x in self.__stem_loops if x not in removed]
+            kept_ids = set(id(x) for x, _, _ in kept)
+            added = [x for x in heard if x is not rec_loop and id(x) not in kept_ids]
+            is_full |= self.__stem is not None and any(len(self.__stem) % x.length for x in added)
+
+            if is_full:
+                self.__mix_stem(heard, rec_loop)
+            else:
+                for loop, _, is_reverse in removed:
+                    loop.mix_into(self.__stem, is_reverse, -1)
+                    loop.mark_dirty()
+                for loop in added:
+                    loop.fold_into(self.__stem)
+                self.__set_stem_loops([x for x, _, _ in kept] + added)
+
+            self.__stem_key = key
+
+    def __mix_stem(self, heard: List[LoopWithDrum], rec_loop: Union[LoopWithDrum, None]) -> None:
+        """mix all heard loops except the one recorded now, other loops will be added as a whole"""
+        loops = [x for x in heard if x is not rec_loop]
+        stem_len = lcm(*[x.length for x in loops]) if loops else 0
+        if stem_len == 0 or stem_len > MAX_LEN:
+            self.__stem = None
+            loops = []
+        else:
+            self.__stem = np.zeros((stem_len, 2), MIX_TYPE)
+            for loop in loops:
+                loop.take_dirty()
+                loop.mix_into(self.__stem, loop.is_reverse)
+
+        for loop in [x for x in self.items if x not in loops]:
+            loop.mark_dirty()
+        self.__set_stem_loops(loops)
+
     def play_samples(self, out_data: np.ndarray, idx: int) -> None:
         self._ctrl.drum.play_samples(out_data, idx)
-        for loop in self.items:
+        loops = self.items
+        if self.__lock.acquire(blocking=False):
+            if self.__is_stem_valid(self.__heard_loops()):
+                if self.__stem is not None:
+                    play_sound_buff(self.__stem, out_data, idx)
+                loops = [x for x in self.items if id(x) not in self.__stem_ids]
+            self.__lock.release()
+
+        for loop in loops:
             if not loop.is_silent:
                 WrapBuffer.play_samples(loop, out_data, idx)
 
     def record_samples(self, in_data: np.ndarray, idx: int) -> None:
+        """Overdub of loop in stem is added to stem right away.
+        Otherwise loop keeps written regions to add them to stem later"""
         loop = self.get_item_now()
-        WrapBuffer.record_samples(loop, in_data, idx)
+        if self.__lock.acquire(blocking=False):
+            is_stem = id(loop) in self.__stem_ids and self.__is_stem_valid(self.__heard_loops())
+            WrapBuffer.record_samples(loop, in_data, idx, not is_stem)
+            if is_stem:
+                loop.record_into(self.__stem, in_data, idx)
+            self.__lock.release()
+        else:
+            WrapBuffer.record_samples(loop, in_data, idx)
 
     def state_str(self, is_now: bool, is_next: bool, is_rec: bool) -> str:
         """colored string to show state of loops"""
@@ -0,0 +1,57 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, Future
+from pathlib import Path
+from typing import Callable, List, Union
+
+from loop._songfile import SongFile, SongSnapshot
+from loop._songpart import SongPart
+
+
+class SongSaver:
+    """Song is written by worker thread from snapshot of its parts, so playback and pedals
+    go on while it is saved. Saves are written one after another"""
+
+    def __init__(self, on_change: Callable[[], None]):
+        self.__executor: ThreadPoolExecutor = ThreadPoolExecutor(1, "song_saver")
+        self.__future: Union[Future, None] = None
+        self.__on_change: Callable[[], None] = on_change  # called when status changes
+        self.status: str = ""
+
+    def save(self, path: Path, drum_length: int, parts: List[Union[SongPart, None]], with_history: bool) -> None:
+        """snapshot is taken by caller thread, it is cheap"""
+        snapshot = SongFile.snapshot(drum_length, parts, with_history)
+        self.__set_status("saving")
+        self.__future = self.__executor.submit(self.__write, path, snapshot)
+
+    def wait(self) -> None:
+        """wait until started saves are written"""
+        if self.__future is not None:
+            self.__future.result()
+
+    def collect_garbage(self, dir_name: Path) -> None:
+        """after song is deleted, its loops not used by other songs are deleted"""
+        self.__future = self.__executor.submit(self.__collect_garbage, dir_name)
+
+    def __write(self, path: Path, snapshot: SongSnapshot) -> None:
+        try:
+            SongFile.write(path, snapshot, lambda done, total: self.__set_status(f"saving {100 * done // total}%"))
+            self.__set_status("saved")
+        except (OSError, ValueError) as err:
+            logging.error(f"Failed to save song {path}: {err}")
+            self.__set_status("save failed")
+        self.__collect_garbage(path.parent)
+
+    @staticmethod
+    def __collect_garbage(dir_name: Path) -> None:
+        try:
+            SongFile.collect_garbage(dir_name)
+        except (OSError, ValueError) as err:
+            logging.error(f"Failed to delete unused loops in {dir_name}: {err}")
+
+    def __set_status(self, status: str) -> None:
+        self.status = status
+        self.__on_change()
+
+
+if __name__ == "__main__":
+    pass
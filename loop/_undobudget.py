@@ -0,0 +1,77 @@
+from typing import List, Union
+
+from loop._songpart import SongPart
+from loop._wrapbuffer import WrapBuffer
+from utils import always_true
+
+
+class UndoBudget:
+    """Looper wide limit for memory kept by undo and redo of all loops and by deleted loops.
+    Oldest entries are spilled to memory mapped temporary files or dropped.
+    The most recent undo and redo of each loop are always kept in memory"""
+
+    def __init__(self, limit_mb: float, spill: bool, spill_dir: Union[str, None] = None):
+        self.limit: int = int(limit_mb * 1024 * 1024)
+        self.spill: bool = spill
+        self.spill_dir: Union[str, None] = spill_dir or None
+        self.used: int = 0
+
+    @staticmethod
+    def __loops(parts: List[SongPart]) -> List[WrapBuffer]:
+        return [loop for part in parts for loop in [*part.items, *part.backup]]
+
+    @staticmethod
+    def __deleted_bytes(parts: List[SongPart]) -> int:
+        return sum(loop.nbytes for part in parts for loop in part.backup)
+
+    def measure(self, parts: List[SongPart]) -> int:
+        """bytes kept by history of all loops"""
+        self.used = sum(x.history_bytes() for x in self.__loops(parts)) + self.__deleted_bytes(parts)
+        return self.used
+
+    def enforce(self, parts: List[SongPart]) -> None:
+        """called from control thread after each message"""
+        if self.limit <= 0 or self.measure(parts) <= self.limit:
+            return
+
+        assert always_true(f"Undo history {self.used} bytes is over limit {self.limit}")
+        loops = self.__loops(parts)
+        if self.spill:
+            self.__spill(loops)
+        else:
+            self.__drop(loops)
+
+        for part in parts:
+            while self.used > self.limit and part.backup:
+                part.backup.pop(0)
+                self.measure(parts)
+
+        assert always_true(f"Undo history {self.used} bytes after {'spill' if self.spill else 'drop'}")
+
+    def __spill(self, loops: List[WrapBuffer]) -> None:
+        old = [(x.seq, k, x) for k, loop in enumerate(loops) for x in loop.old_entries()]
+        for _, _, entry in sorted(old, key=lambda x: x[:2]):
+            if self.used <= self.limit:
+                break
+            self.used -= entry.ram_bytes
+            entry.spill(self.spill_dir)
+            self.used += entry.ram_bytes
+
+    def __drop(self, loops: List[WrapBuffer]) -> None:
+        """entries are dropped from start of undo or redo of loop, only freed memory is counted"""
+        while self.used > self.limit:
+            heads = [(x.seq, k, x) for k, loop in enumerate(loops) for x in loop.oldest_entries()]
+            if not heads:
+                break
+            _, k, entry = min(heads, key=lambda x: (x[0], x[1]))
+            freed = entry.ram_bytes
+            if not loops[k].drop_entry(entry):
+                break
+            self.used -= freed
+
+    def __str__(self):
+        return f"{self.__class__.__name__} used={self.used} limit={self.limit} spill={self.spill}"
+
+
+if __name__ == "__main__":
+    pass
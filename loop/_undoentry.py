@@ -0,0 +1,130 @@
+import tempfile
+from itertools import count
+from typing import Dict, Union, Optional, Set
+
+import numpy as np
+
+from utils import CHUNK_LEN
+
+_seq_counter = count()
+
+
+class UndoEntry:
+    """Saved state of WrapBuffer. Full entry keeps whole buffer. Chunk entry keeps only
+    chunks that differ from the state next to it in history, other chunks are shared.
+    Chunk that was all zero is kept as None"""
+
+    def __init__(self, length: int, buff: Union[np.ndarray, None] = None):
+        self.length: int = length
+        self.buff: Union[np.ndarray, None] = buff
+        self.chunks: Dict[int, Optional[np.ndarray]] = dict()
+        self.seq: int = next(_seq_counter)  # entries with smaller seq are older
+        self.snapshot_of: Union[np.ndarray, None] = None  # buffer shared by snapshot being saved
+        self.edits: int = 0  # count of buffer edits when snapshot was taken
+        self.is_spilled: bool = False  # full buffer is kept in file
+        self.spilled_chunks: Set[int] = set()  # chunks kept in file, chunks saved later are in memory
+
+    def __getstate__(self):
+        # spilled arrays are saved as ordinary arrays
+        state = self.__dict__.copy()
+        state["buff"] = None if self.buff is None else np.array(self.buff)
+        state["chunks"] = {k: None if v is None else np.array(v) for k, v in self.chunks.items()}
+        del state["seq"]
+        state["is_spilled"], state["spilled_chunks"] = False, set()
+        return state
+
+    def __setstate__(self, state):
+        self.is_spilled, self.spilled_chunks = False, set()
+        self.__dict__.update(state)
+        self.seq = next(_seq_counter)
+
+    @property
+    def is_full(self) -> bool:
+        return self.buff is not None
+
+    @property
+    def nbytes(self) -> int:
+        if self.is_full:
+            return self.buff.nbytes
+        return sum(x.nbytes for x in self.chunks.values() if x is not None)
+
+    @property
+    def ram_bytes(self) -> int:
+        """bytes kept in memory, spilled arrays are not counted"""
+        if self.is_full:
+            return 0 if self.is_spilled else self.buff.nbytes
+        return sum(x.nbytes for k, x in self.__chunks_in_ram().items())
+
+    def __chunks_in_ram(self) -> Dict[int, np.ndarray]:
+        return {k: x for k, x in self.chunks.items() if x is not None and k not in self.spilled_chunks}
+
+    def spill(self, directory: Union[str, None]) -> None:
+        """Move saved arrays to memory mapped temporary file. Mapped arrays of loaded songs
+        are copies in memory, so spilled arrays are tracked by flag, not by their type"""
+        if self.is_full and self.is_spilled:
+            return
+        arrays = [self.buff] if self.is_full else list(self.__chunks_in_ram().values())
+        size = sum(len(x) for x in arrays)
+        if size == 0:
+            return
+
+        with tempfile.TemporaryFile(prefix="undo_", dir=directory) as f:
+            mm = np.memmap(f, dtype=arrays[0].dtype, mode="w+", shape=(size, *arrays[0].shape[1:]))
+
+        pos = 0
+        if self.is_full:
+            mm[:] = self.buff
+            self.buff = mm
+            self.is_spilled = True
+            return
+        for k, chunk in self.__chunks_in_ram().items():
+            mm[pos:pos + len(chunk)] = chunk
+            self.chunks[k] = mm[pos:pos + len(chunk)]
+            self.spilled_chunks.add(k)
+            pos += len(chunk)
+
+    def load(self) -> None:
+        """full entry becomes loop buffer, it must be in memory"""
+        if self.is_full and self.is_spilled:
+            self.buff = np.array(self.buff)
+            self.is_spilled = False
+
+    def save_chunk(self, buff: np.ndarray, k: int, is_used: bool) -> None:
+        """keep copy of chunk before it is changed, zero chunk is not copied.
+        Copy is ordinary array also for mapped buffer"""
+        if k not in self.chunks:
+            self.chunks[k] = np.array(buff[k * CHUNK_LEN:(k + 1) * CHUNK_LEN]) if is_used else None
+
+    def swap(self, buff: np.ndarray, used: np.ndarray) -> "UndoEntry":
+        """Put saved state into buff. Returns entry to go back to the state that buff had,
+        for full entry saved buffer must replace buff. Used is occupancy map of buff chunks"""
+        if self.is_full:
+            return UndoEntry(len(buff), buff)
+
+        assert self.length == len(buff), "chunk entry must have same length as buffer"
+        other = UndoEntry(len(buff))
+        for k, chunk in list(self.chunks.items()):
+            other.save_chunk(buff, k, used[k])
+            buff[k * CHUNK_LEN:(k + 1) * CHUNK_LEN] = 0 if chunk is None else chunk
+        return other
+
+    def make_full(self, buff: np.ndarray, can_change: bool) -> None:
+        """Entry must not depend on buff as buff will be replaced.
+        If buff is not used any more it keeps saved state without a copy"""
+        if self.is_full:
+            return
+        if not can_change:
+            buff = np.array(buff)
+        for k, chunk in list(self.chunks.items()):
+            buff[k * CHUNK_LEN:(k + 1) * CHUNK_LEN] = 0 if chunk is None else chunk
+        self.buff = buff
+        self.chunks.clear()
+        self.spilled_chunks.clear()
+
+    def __str__(self):
+        return f"{self.__class__.__name__} full={self.is_full} chunks={len(self.chunks)} " \
+               f"bytes={self.nbytes} ram={self.ram_bytes}"
+
+
+if __name__ == "__main__":
+    pass
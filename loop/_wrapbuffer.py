@@ -1,57 +1,354 @@
-from typing import List, Any
+import math
+from pathlib import Path
+from typing import List, Tuple, Union
 
 import numpy as np
 
+from loop._songhistory import HistoryRef, EntryState
+from loop._undoentry import UndoEntry
 from utils import record_sound_buff, play_sound_buff, SD_RATE, SD_MAX, always_true, decibels
-from utils import sound_test, make_zero_buffer, MAX_LEN
+from utils import sound_test, buffer_pool, fit_channels, find_chunk_stats, MAX_LEN, CHUNK_LEN, IN_CH
 
 
 class WrapBuffer:
-    """buffer that can wrap over the end when get and set data. Can undo, redo"""
+    """buffer that can wrap over the end when get and set data. Can undo, redo.
+    Undo and redo keep only chunks changed by recording.
+    Loops recorded from mono input keep one channel, it is played to both outputs"""
 
-    def __init__(self, length: int = MAX_LEN):
+    def __init__(self, length: int = MAX_LEN, channels: int = IN_CH):
         self.is_reverse: bool = False
-        self.__buff: np.ndarray = make_zero_buffer(length)
-        self.__volume: float = -1
+        self.__buff: np.ndarray = buffer_pool.take(length, channels)
         self.__start: int = -1
-        self.__undo: List[Any] = []
-        self.__redo: List[Any] = []
+        self.__undo: List[UndoEntry] = []
+        self.__redo: List[UndoEntry] = []
+        self.__snapshots: List[UndoEntry] = []  # states being saved, they keep chunks before they change
+        self.__history: Union[HistoryRef, None] = None  # saved history older than undo, not loaded yet
+        self.__version: int = 0  # changes when buffer content is replaced
+        self.__edits: int = 0  # changes when buffer content changes in any way
+        self.__content_hash: Tuple[int, str] = (-1, "")  # edits count and hash of saved content
+        self.__dirty: List[Tuple[int, int]] = []  # recorded regions not yet added to a stem
+        self.__peaks: np.ndarray = np.zeros(self.__chunk_count(), np.int32)  # zero peak means silent chunk
+        self.__squares: np.ndarray = np.zeros(self.__chunk_count(), np.float64)  # sum of squares of chunk
+        self.__peak: int = 0  # peak of whole buffer, negative if not known
+        self.__square_sum: float = 0
+
+    def __getstate__(self):
+        # mapped buffer of loaded song is pickled and copied as ordinary array
+        state = self.__dict__.copy()
+        state["_WrapBuffer__buff"] = np.array(self.__buff)
+        state["_WrapBuffer__snapshots"] = []
+        return state
+
+    def __setstate__(self, state):
+        # songs saved by older versions miss some fields
+        self.__version = 0
+        self.__edits = 0
+        self.__content_hash = (-1, "")
+        self.__dict__.update(state)
+        self.__snapshots = []
+        self.__history = self.__dict__.get("_WrapBuffer__history")
+        self.__undo = [x if isinstance(x, UndoEntry) else UndoEntry(len(x), x) for x in self.__undo]
+        self.__redo = [x if isinstance(x, UndoEntry) else UndoEntry(len(x), x) for x in self.__redo]
+        self.__dict__.pop("_WrapBuffer__volume", None)
+        self.__find_stats()
+        self.mark_dirty()
+
+    def __chunk_count(self) -> int:
+        return -(-len(self.__buff) // CHUNK_LEN)
+
+    def __find_stats(self) -> None:
+        """peak and sum of squares of all chunks"""
+        self.__peaks, self.__squares = find_chunk_stats(self.__buff)
+        self.__square_sum = float(self.__squares.sum())
+        self.__peak = int(self.__peaks.max(initial=0))
+
+    def __chunk_stats(self, k: int) -> None:
+        """recalculate one chunk after it was changed, peak of buffer is found again if it may go down"""
+        chunk = self.__buff[k * CHUNK_LEN:(k + 1) * CHUNK_LEN]
+        peak = max(int(chunk.max()), -int(chunk.min()))
+        square = float(np.einsum("ij,ij->", chunk, chunk, dtype=np.float64))
+        if self.__peaks[k] == self.__peak and peak < self.__peak:
+            self.__peak = -1
+        elif 0 <= self.__peak < peak:
+            self.__peak = peak
+        self.__square_sum += square - self.__squares[k]
+        self.__peaks[k] = peak
+        self.__squares[k] = square
+
+    def __update_stats(self, start: int, data_len: int) -> None:
+        end = start + data_len
+        if end > len(self.__buff):
+            self.__update_stats(start, len(self.__buff) - start)
+            self.__update_stats(0, end - len(self.__buff))
+            return
+        for k in range(start // CHUNK_LEN, (end - 1) // CHUNK_LEN + 1):
+            self.__chunk_stats(k)
+
+    @property
+    def peak(self) -> int:
+        """absolute peak of buffer samples"""
+        if self.__peak < 0:
+            self.__peak = int(self.__peaks.max(initial=0))
+        return self.__peak
+
+    @property
+    def rms(self) -> float:
+        """root mean square of buffer samples"""
+        return math.sqrt(max(self.__square_sum, 0) / self.__buff.size)
+
+    def __is_silent(self, idx: int, data_len: int, is_reverse: bool) -> bool:
+        """all chunks played from idx are zero"""
+        buff_len = len(self.__buff)
+        start = idx % buff_len
+        if is_reverse:
+            start = (buff_len - start - data_len) % buff_len
+        end = start + data_len
+        if end <= buff_len:
+            return not self.__peaks[start // CHUNK_LEN:(end - 1) // CHUNK_LEN + 1].any()
+        end -= buff_len
+        return not (self.__peaks[start // CHUNK_LEN:].any() or self.__peaks[:(end - 1) // CHUNK_LEN + 1].any())
+
+    def __used_ranges(self) -> List[Tuple[int, int]]:
+        """regions of buffer made of chunks that are not zero"""
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], self.__peaks > 0, [0]))))
+        return [(start * CHUNK_LEN, min(end * CHUNK_LEN, len(self.__buff))) for start, end in edges.reshape((-1, 2))]
 
     @property
     def length(self) -> int:
         return len(self.__buff)
 
+    @property
+    def channels(self) -> int:
+        return self.__buff.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.__buff.nbytes
+
+    @property
+    def version(self) -> int:
+        return self.__version
+
     @property
     def is_empty(self) -> bool:
         return len(self.__buff) == MAX_LEN
 
+    def __replace_buff(self, buff: np.ndarray, can_change: bool) -> bool:
+        """History entries next to current state must not share chunks with replaced buffer.
+        If it is not used by new buffer it is changed to keep their state.
+        Returns True if replaced buffer is kept by history"""
+        self.__keep_snapshots()
+        is_kept = False
+        for entries in [self.__undo, self.__redo]:
+            if entries and not entries[-1].is_full:
+                entries[-1].make_full(self.__buff, can_change)
+                is_kept = is_kept or can_change
+                can_change = False
+        self.__buff = buff
+        self.__version += 1
+        self.__edits += 1
+        self.__find_stats()
+        self.mark_dirty()
+        return is_kept
+
+    def __move_to(self, buff: np.ndarray) -> None:
+        """replace buffer by new one from pool, old one goes back to pool if history does not keep it"""
+        old = self.__buff
+        if self.__replace_buff(buff, True):
+            return
+        if any(np.may_share_memory(x.buff, old) for x in [*self.__undo, *self.__redo] if x.is_full):
+            return
+        buffer_pool.give(old)
+
     def resize_buff(self, length: int) -> None:
+        """buffer grown for recording is taken from paged in reserve of pool"""
         diff = length - len(self.__buff)
         if diff > 0:
-            self.__buff = np.concatenate((self.__buff, make_zero_buffer(diff)), axis=0)
+            new_buff = buffer_pool.take(length, self.channels, True)
+            new_buff[:len(self.__buff)] = self.__buff
+            self.__move_to(new_buff)
         elif diff < 0:
-            self.__buff = self.__buff[0, length]
+            self.__replace_buff(self.__buff[:length], False)
 
     def get_buff_copy(self) -> np.ndarray:
         return self.__buff.copy()
 
+    def take_snapshot(self) -> UndoEntry:
+        """State of buffer that is read later by read_snapshot. Recording and undo
+        go on meanwhile, chunks are copied to snapshot only before they change"""
+        entry = UndoEntry(len(self.__buff))
+        entry.snapshot_of = self.__buff
+        entry.edits = self.__edits
+        self.__snapshots.append(entry)
+        return entry
+
+    def __keep_snapshots(self, chunks=None) -> None:
+        """snapshots keep chunks that are changed in place, or whole buffer if it is replaced"""
+        for entry in [x for x in self.__snapshots if not x.is_full]:
+            if chunks is None:
+                entry.make_full(self.__buff, False)
+            else:
+                for k in chunks:
+                    entry.save_chunk(self.__buff, k, self.__peaks[k] > 0)
+
+    def read_snapshot(self, entry: UndoEntry) -> np.ndarray:
+        """Chunk is read from buffer and taken from snapshot if it was saved there meanwhile"""
+        buff = entry.buff
+        if buff is None:
+            buff = entry.snapshot_of.copy()
+            for k, chunk in list(entry.chunks.items()):
+                buff[k * CHUNK_LEN:(k + 1) * CHUNK_LEN] = 0 if chunk is None else chunk
+            if entry.is_full:
+                buff = entry.buff
+        return buff
+
+    def drop_snapshot(self, entry: UndoEntry) -> None:
+        if entry in self.__snapshots:
+            self.__snapshots.remove(entry)
+
+    def snapshot_hash(self, entry: UndoEntry) -> str:
+        """hash of content if it is known for the state of snapshot, otherwise empty string"""
+        edits, content_hash = self.__content_hash
+        return content_hash if edits == entry.edits else ""
+
+    def set_snapshot_hash(self, entry: UndoEntry, content_hash: str) -> None:
+        """it is valid until buffer is changed after snapshot"""
+        self.__content_hash = (entry.edits, content_hash)
+
+    def read_files(self, name: Path, content_hash: str = "") -> None:
+        """Buffer is memory mapped copy on write, recording never changes the file.
+        Audio is read by the OS when it is played, stats are read from their file"""
+        old = self.__buff
+        self.__buff = np.load(name.with_suffix(".npy"), mmap_mode='c')
+        self.__version += 1
+        self.__edits += 1
+        self.__content_hash = (self.__edits, content_hash)
+        try:
+            peaks, squares = np.load(name.with_suffix(".stats.npy"))
+            assert len(peaks) == self.__chunk_count()
+            self.__peaks = peaks.astype(np.int32)
+            self.__squares = squares
+            self.__square_sum = float(self.__squares.sum())
+            self.__peak = int(self.__peaks.max(initial=0))
+        except (OSError, ValueError, AssertionError):
+            self.__find_stats()
+        self.mark_dirty()
+        buffer_pool.give(old)
+
+    def read_pages(self) -> None:
+        """mapped buffer is read by the OS now, so playback does not wait for disk"""
+        if isinstance(self.__buff, np.memmap):
+            int(self.__buff[::1024].sum())
+
     def zero_buff(self) -> None:
+        self.__replace_buff(self.__buff, False)
         self.__buff[:] = 0
-
-    def record_samples(self, in_data: np.ndarray, idx: int) -> None:
-        """Record and fix start for empty, recalculate volume for non empty"""
-        if self.is_empty:
-            if self.__start < 0:
-                self.__start = idx
-        elif self.__volume >= 0:
-            self.__volume = -1
-
+        self.__peaks[:] = 0
+        self.__squares[:] = 0
+        self.__peak = 0
+        self.__square_sum = 0
+        self.__dirty.clear()
+
+    def record_samples(self, in_data: np.ndarray, idx: int, is_dirty: bool = True) -> None:
+        """Record and fix start for empty, recalculate peak and RMS of written chunks.
+        Written region is dirty unless caller added it to a stem"""
+        if self.is_empty and self.__start < 0:
+            self.__start = idx
+
+        self.__save_chunks(idx % len(self.__buff), len(in_data))
         record_sound_buff(self.__buff, in_data, idx)
+        if in_data.any():
+            self.__update_stats(idx % len(self.__buff), len(in_data))
+        if is_dirty:
+            self.__add_dirty(idx % len(self.__buff), len(in_data))
+        self.__edits += 1
+
+    def __save_chunks(self, start: int, data_len: int) -> None:
+        """copy chunks before they change if history next to current state shares them"""
+        end = start + data_len
+        if end > len(self.__buff):
+            self.__save_chunks(start, len(self.__buff) - start)
+            self.__save_chunks(0, end - len(self.__buff))
+            return
+
+        entries = [x[-1] for x in [self.__undo, self.__redo] if x]
+        for entry in [x for x in [*entries, *self.__snapshots] if not x.is_full]:
+            for k in range(start // CHUNK_LEN, (end - 1) // CHUNK_LEN + 1):
+                entry.save_chunk(self.__buff, k, self.__peaks[k] > 0)
+
+    def __add_dirty(self, start: int, data_len: int) -> None:
+        end = start + data_len
+        if end > len(self.__buff):
+            self.__add_dirty(start, len(self.__buff) - start)
+            self.__add_dirty(0, end - len(self.__buff))
+        elif self.__dirty and self.__dirty[-1][1] == start:
+            self.__dirty[-1] = (self.__dirty[-1][0], end)
+        else:
+            self.__dirty.append((start, end))
+
+    def mark_dirty(self) -> None:
+        """whole buffer is not in a stem"""
+        self.__dirty = [(0, len(self.__buff))]
+
+    def has_dirty(self) -> bool:
+        return len(self.__dirty) > 0
+
+    def take_dirty(self) -> List[Tuple[int, int]]:
+        """recorded regions, overlapping ones are merged"""
+        dirty, self.__dirty = self.__dirty, []
+        merged: List[Tuple[int, int]] = []
+        for start, end in sorted(dirty):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+            else:
+                merged.append((start, end))
+        return merged
 
     def play_samples(self, out_data: np.ndarray, idx: int) -> None:
+        if self.__is_silent(idx, len(out_data), self.is_reverse):
+            return
         tmp = self.__buff[::-1] if self.is_reverse else self.__buff
         play_sound_buff(tmp, out_data, idx)
 
+    def mix_into(self, acc: np.ndarray, is_reverse: bool, sign: int = 1) -> None:
+        """add or subtract whole buffer to/from accumulator (stem),
+        accumulator length must be multiple of buffer length. Zero chunks are skipped"""
+        if not self.__peaks.all():
+            for start, end in self.__used_ranges():
+                self.__add_into(acc, self.__buff[start:end], start, is_reverse, sign)
+            return
+
+        tmp = self.__buff[::-1] if is_reverse else self.__buff
+        if sign >= 0:
+            acc.reshape((-1, len(tmp), acc.shape[1]))[:] += tmp
+        else:
+            acc.reshape((-1, len(tmp), acc.shape[1]))[:] -= tmp
+
+    def fold_into(self, acc: np.ndarray) -> None:
+        """add regions recorded since last call to accumulator, rest of buffer must be in it already"""
+        for start, end in self.take_dirty():
+            self.__add_into(acc, self.__buff[start:end], start, self.is_reverse)
+
+    def record_into(self, acc: np.ndarray, in_data: np.ndarray, idx: int) -> None:
+        """add data recorded at idx to accumulator that has this buffer mixed in"""
+        self.__add_into(acc, fit_channels(in_data, self.channels), idx % len(self.__buff), self.is_reverse)
+
+    def __add_into(self, acc: np.ndarray, np_data: np.ndarray, start: int, is_reverse: bool, sign: int = 1) -> None:
+        """add data written to buffer at start to all places of accumulator where it is heard"""
+        buff_len = len(self.__buff)
+        data_len = len(np_data)
+        if is_reverse:
+            np_data = np_data[::-1]
+            start = (buff_len - start - data_len) % buff_len
+        acc3 = acc.reshape((-1, buff_len, acc.shape[1]))
+        first = min(data_len, buff_len - start)
+        if sign >= 0:
+            acc3[:, start:start + first] += np_data[:first]
+            acc3[:, :data_len - first] += np_data[first:]
+        else:
+            acc3[:, start:start + first] -= np_data[:first]
+            acc3[:, :data_len - first] -= np_data[first:]
+
     def sound_test(self, duration_sec: float, record: bool) -> None:
         sound_test(self.__buff, duration_sec, record)
 
@@ -66,7 +363,9 @@ class WrapBuffer:
         if trim_len <= 0:
             assert self.__start == 0, f"start must be zero"
             assert idx < len(self.__buff), f"end of recording beyond buffer"
-            self.__buff = self.__buff[:idx]
+            tail = self.__buff[idx:]
+            self.__replace_buff(self.__buff[:idx], False)
+            buffer_pool.give(tail)
             return
 
         rec_len: int = idx - self.__start
@@ -86,47 +385,108 @@ class WrapBuffer:
 
         assert self.__start >= 0
 
-        new_buff = make_zero_buffer(rec_len)
+        new_buff = buffer_pool.take(rec_len, self.channels)
         play_sound_buff(self.__buff, new_buff, self.__start)
-        self.__buff = new_buff
+        self.__move_to(new_buff)
 
         assert always_true(f"after trim: len {len(self.__buff)} trim_len {trim_len} start {self.__start} idx {idx}")
         assert self.length % trim_len == 0 and self.length > 0, "incorrect buffer trim"
 
+    def __restore(self, entry: UndoEntry) -> UndoEntry:
+        """put saved state into buffer, returns entry with replaced state"""
+        self.__keep_snapshots(None if entry.is_full else list(entry.chunks))
+        entry.load()
+        other = entry.swap(self.__buff, self.__peaks > 0)
+        if entry.is_full:
+            self.__buff = entry.buff
+            self.__find_stats()
+        else:
+            for k in entry.chunks:
+                self.__chunk_stats(k)
+        self.__version += 1
+        self.__edits += 1
+        self.mark_dirty()
+        return other
+
     def redo(self) -> None:
+        self.load_history()
         if len(self.__redo) > 0:
-            self.__undo.append(self.__buff)
-            self.__buff = self.__redo.pop()
-            self.__volume = -1
+            self.__undo.append(self.__restore(self.__redo.pop()))
 
     def get_undo_len(self) -> int:
-        return len(self.__undo)
+        return len(self.__undo) + (len(self.__history.undo) if self.__history else 0)
 
     def undo(self) -> None:
+        self.load_history()
         if len(self.__undo) > 0:
-            self.__redo.append(self.__buff)
-            self.__buff = self.__undo.pop()
-            self.__volume = -1
+            self.__redo.append(self.__restore(self.__undo.pop()))
 
     def save_undo(self) -> None:
+        """snapshot shares all chunks with buffer until they are recorded"""
         if not self.is_empty:
             self.__redo.clear()
-            self.__undo.append(self.__buff.copy())
+            if self.__history:
+                self.__history.redo = []
+            self.__undo.append(UndoEntry(len(self.__buff)))
+
+    def set_history(self, history: Union[HistoryRef, None]) -> None:
+        """saved history is loaded when undo or redo is used"""
+        self.__history = history
+
+    def load_history(self) -> None:
+        """saved entries go below entries made since loop was loaded, they get lower seq to stay older.
+        History is loaded before song is saved without it, so its files may be deleted"""
+        if self.__history:
+            undo, redo = self.__history.load()
+            low = min((x.seq for x in [*self.__undo, *self.__redo]), default=None)
+            if low is not None:
+                for k, entry in enumerate([*undo, *redo]):
+                    entry.seq = low - len(undo) - len(redo) + k
+            self.__undo = undo + self.__undo
+            self.__redo = redo + self.__redo
+            self.__history = None
+
+    def history_state(self) -> Tuple[Union[HistoryRef, None], List[EntryState], List[EntryState]]:
+        """history for snapshot, chunk entries next to loop state may still get chunks"""
+        return self.__history, [(x.length, x.buff, dict(x.chunks)) for x in self.__undo], \
+            [(x.length, x.buff, dict(x.chunks)) for x in self.__redo]
+
+    def history_bytes(self) -> int:
+        """memory kept by undo and redo entries"""
+        return sum(x.ram_bytes for x in [*self.__undo, *self.__redo])
+
+    def old_entries(self) -> List[UndoEntry]:
+        """entries that may be spilled or dropped, the most recent undo and redo are kept"""
+        return [*self.__undo[:-1], *self.__redo[:-1]]
+
+    def oldest_entries(self) -> List[UndoEntry]:
+        """first entries of undo and redo that may be dropped, the most recent ones are kept"""
+        return [x[0] for x in [self.__undo, self.__redo] if len(x) > 1]
+
+    def drop_entry(self, entry: UndoEntry) -> bool:
+        """only the oldest entry of undo or redo can be dropped, returns True if it was dropped"""
+        for entries in [self.__undo, self.__redo]:
+            if len(entries) > 1 and entries[0] is entry:
+                entries.pop(0)
+                return True
+        return False
 
     def info_str(self, cols: int) -> str:
         """Colored string to show volume and length"""
         if self.is_empty:
             return '-' * cols
 
-        if self.__volume < 0:
-            self.__volume = -decibels(np.max(self.__buff) / SD_MAX)
-
         sec_len = self.length / SD_RATE
-        return "{:06.2F}".format(sec_len) + '-' * (cols - 10) + "{:04.1F}".format(self.__volume)
+        return "{:06.2F}".format(sec_len) + '-' * (cols - 10) + "{:04.1F}".format(self.volume)
+
+    @property
+    def volume(self) -> float:
+        """peak in decibels below full scale"""
+        return -decibels(max(self.peak, 1) / SD_MAX)
 
     def __str__(self):
         return f"{self.__class__.__name__} sec={self.length / SD_RATE:.2F} " \
-               f"vol={self.__volume:.2F} undo={len(self.__undo)} redo={len(self.__redo)}"
+               f"ch={self.channels} vol={self.volume:.2F} rms={self.rms:.0F} undo={len(self.__undo)} redo={len(self.__redo)}"
 
 
 if __name__ == "__main__":
@@ -0,0 +1,59 @@
+"""Benchmark of song part callback time against number of loops.
+Run on target device: python3 -O -m tests.bench_mixing"""
+import time
+
+import numpy as np
+
+from drum import FakeDrum
+# noinspection PyProtectedMember
+from loop._loopsimple import LoopWithDrum
+# noinspection PyProtectedMember
+from loop._oneloopctrl import OneLoopCtrl
+from loop import SongPart
+from utils import MixBus, make_sin_sound, SD_RATE
+
+BLOCK_LEN = 512
+LOOP_SECONDS = 4
+REPEAT = 2000
+
+
+def make_part(ctrl: OneLoopCtrl, loop_count: int) -> SongPart:
+    part = SongPart(ctrl)
+    part.items.clear()
+    for k in range(loop_count):
+        loop_len = LOOP_SECONDS * SD_RATE * (1 + k % 2)
+        loop = LoopWithDrum(ctrl, loop_len)
+        loop.record_samples(make_sin_sound(110 * (k + 1), loop_len / SD_RATE, 8000), 0)
+        part.items.append(loop)
+    part.update_stem()
+    return part
+
+
+def bench_part(part: SongPart) -> float:
+    """returns average callback time in microseconds"""
+    bus = MixBus()
+    out_data = np.zeros((BLOCK_LEN, 2), 'int16')
+    idx = 0
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        mix = bus.get_block(BLOCK_LEN)
+        part.play_samples(mix, idx)
+        MixBus.clip_into(mix, out_data)
+        idx += BLOCK_LEN
+    return (time.perf_counter() - start) / REPEAT * 1e6
+
+
+def main():
+    ctrl = OneLoopCtrl()
+    ctrl._drum = FakeDrum()
+    budget = BLOCK_LEN / SD_RATE * 1e6
+    print(f"block {BLOCK_LEN} samples, real time budget {budget:.0f} us")
+    print("loops".rjust(6), "us/callback".rjust(12), "% budget".rjust(9))
+    for loop_count in [1, 2, 4, 8, 16]:
+        part = make_part(ctrl, loop_count)
+        usec = bench_part(part)
+        print(f"{loop_count:6d} {usec:12.1f} {usec / budget * 100:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
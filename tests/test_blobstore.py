@@ -0,0 +1,66 @@
+import copy
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import TestCase
+
+from drum import FakeDrum
+from loop import SongPart
+# noinspection PyProtectedMember
+from loop._loopsimple import LoopWithDrum
+# noinspection PyProtectedMember
+from loop._oneloopctrl import OneLoopCtrl
+# noinspection PyProtectedMember
+from loop._songfile import SongFile
+from utils import make_sin_sound, CHUNK_LEN
+
+control = OneLoopCtrl()
+control._drum = FakeDrum()
+sound = make_sin_sound(300, 1)
+
+
+def make_part(k: int) -> SongPart:
+    part = SongPart(control)
+    part.items.clear()
+    loop = LoopWithDrum(control, CHUNK_LEN * 4)
+    loop.record_samples(sound[:CHUNK_LEN] // (k + 1), 0)
+    part.items.append(loop)
+    return part
+
+
+def count_blobs(tmp: str) -> int:
+    return len(list(Path(tmp, SongFile.blob_dir).glob("*.stats.npy")))
+
+
+class TestBlobStore(TestCase):
+
+    def test_shared_loops(self):
+        """loops saved before or duplicated are written once"""
+        parts = [make_part(0), make_part(1)]
+        with tempfile.TemporaryDirectory() as tmp:
+            SongFile.save(Path(tmp, "a.sng"), 0, parts)
+            self.assertEqual(count_blobs(tmp), 2)
+            parts.append(SongPart(control))
+            parts[2].items = copy.deepcopy(parts[0].items)
+            SongFile.save(Path(tmp, "b.sng"), 0, parts)
+            self.assertEqual(count_blobs(tmp), 2)
+
+            parts[1].items[0].record_samples(sound[:100], 0)
+            SongFile.save(Path(tmp, "b.sng"), 0, parts)
+            self.assertEqual(count_blobs(tmp), 3)
+            _, loaded = SongFile.load(Path(tmp, "b.sng"), control)
+            self.assertEqual(len(loaded), 3)
+
+    def test_collect_garbage(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            SongFile.save(Path(tmp, "a.sng"), 0, [make_part(0)])
+            SongFile.save(Path(tmp, "b.sng"), 0, [make_part(0), make_part(1)])
+            shutil.rmtree(Path(tmp, "b.sng"))
+            self.assertEqual(SongFile.collect_garbage(Path(tmp)), 1)
+            self.assertEqual(count_blobs(tmp), 1)
+            SongFile.load(Path(tmp, "a.sng"), control)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import time
+import unittest
+from unittest import TestCase
+
+import numpy as np
+
+from utils import BufferPool, MAX_LEN, CHUNK_LEN
+
+
+def wait_free(pool: BufferPool, free_len: int) -> None:
+    for _ in range(200):
+        if pool.free_len >= free_len:
+            return
+        time.sleep(0.01)
+
+
+class TestBufferPool(TestCase):
+
+    def test_reserve(self):
+        pool = BufferPool(1, 0.01)
+        self.assertEqual(pool.take(100).shape, (100, 2))
+        wait_free(pool, MAX_LEN)
+        buff = pool.take(MAX_LEN)
+        self.assertEqual(len(buff), MAX_LEN)
+        self.assertFalse(buff.any())
+        self.assertEqual(pool.free_len, MAX_LEN)  # empty loop does not use paged in reserve
+        # noinspection PyUnresolvedReferences
+        reserve = pool._BufferPool__free[0]
+        buff = pool.take(MAX_LEN, 2, True)  # buffer grown for recording uses reserve
+        self.assertTrue(np.shares_memory(buff, reserve))
+        self.assertFalse(buff.any())
+
+    def test_give(self):
+        pool = BufferPool(0, 0.01)
+        buff = pool.take(CHUNK_LEN * 2)
+        buff[:] = 1000
+        pool.give(buff[CHUNK_LEN:])
+        wait_free(pool, CHUNK_LEN)
+        tail = pool.take(CHUNK_LEN)
+        self.assertTrue(np.shares_memory(tail, buff))
+        self.assertFalse(tail.any())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+from unittest import TestCase
+
+# noinspection PyProtectedMember
+from drum._drumevents import DrumEvents
+
+
+class TestDrumEvents(TestCase):
+
+    def test_order(self):
+        events = DrumEvents()
+        done = []
+        events.add(300, lambda: done.append("c"))
+        events.add(100, lambda: done.append("a"))
+        events.add(100, lambda: done.append("b"))
+        self.assertEqual(events.next_at(), 100)
+        events.run_due(99)
+        self.assertEqual(done, [])
+        events.run_due(200)
+        self.assertEqual(done, ["a", "b"])
+        self.assertEqual(events.next_at(), 300)
+
+    def test_add_from_event(self):
+        events = DrumEvents()
+        done = []
+
+        def repeat():
+            done.append(len(done))
+            events.add(len(done) * 10, repeat)
+
+        events.add(0, repeat)
+        events.run_due(25)
+        self.assertEqual(done, [0, 1, 2])
+        self.assertEqual(len(events), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from unittest import TestCase
+
+import numpy as np
+
+from drum import RealDrum
+# noinspection PyProtectedMember
+from drum._drumloader import DrumLoader
+from utils import MIX_TYPE
+
+drum = RealDrum()
+
+
+def play_bar(length: int, block_len: int) -> np.ndarray:
+    out_data = np.zeros((length * 2, 2), MIX_TYPE)
+    for idx in range(0, len(out_data), block_len):
+        block = out_data[idx:idx + block_len]
+        DrumLoader.play_l1(block, idx)
+        DrumLoader.play_l2(block, idx)
+        DrumLoader.play_bk(block, idx)
+    return out_data
+
+
+class TestDrumHits(TestCase):
+
+    def test_same_as_render(self):
+        """hits mixed at playback sound as rendered bar"""
+        length = 60_000
+        DrumLoader.is_sequencer = False
+        DrumLoader.prepare_all(length)
+        expected = play_bar(length, 512)
+
+        DrumLoader.is_sequencer = True
+        DrumLoader.prepare_all(length)
+        DrumLoader.swap()
+        self.assertEqual(DrumLoader.length, length)
+        result = play_bar(length, 700)
+        DrumLoader.is_sequencer = False
+
+        self.assertTrue(result.any())
+        self.assertLess(np.abs(result - expected).max(), 10)
+
+    def test_render_cache(self):
+        """going back to previous length renders nothing"""
+        DrumLoader.prepare_all(50_000)
+        # noinspection PyUnresolvedReferences
+        rendered = list(DrumLoader._DrumLoader__now.l2)
+        DrumLoader.prepare_all(70_000)
+        self.assertEqual(len(DrumLoader.get_l2()), 70_000)
+        DrumLoader.prepare_all(50_000)
+        # noinspection PyUnresolvedReferences
+        for x, y in zip(DrumLoader._DrumLoader__now.l2, rendered):
+            self.assertIs(x, y)
+
+    def test_swap_at_bar(self):
+        """set prepared for the same length waits for bar boundary"""
+        length = 40_000
+        DrumLoader.prepare_all(length)
+        self.assertEqual(DrumLoader.swap_pos(0, 512), -1)
+        DrumLoader.prepare_all(length)
+        self.assertEqual(DrumLoader.swap_pos(length - 100, 512), 100)
+        self.assertEqual(DrumLoader.swap_pos(length + 100, 512), -1)
+
+        drum.change_intensity(1)
+        drum.play_samples(np.zeros((512, 2), MIX_TYPE), length * 3 - 100)
+        self.assertEqual(DrumLoader.swap_pos(length * 4 - 100, 512), -1)
+
+    def test_clear(self):
+        """callback that started before drums were cleared plays nothing and does not fail"""
+        length = 40_000
+        DrumLoader.prepare_all(length)
+        DrumLoader.prepare_all(length)
+        DrumLoader.clear()
+        self.assertEqual(DrumLoader.swap_pos(length - 100, 512), -1)
+        self.assertFalse(play_bar(1000, 512).any())
+        DrumLoader.prepare_all(length)
+
+
+if __name__ == "__main__":
+    unittest.main()
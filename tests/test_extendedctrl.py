@@ -1,11 +1,23 @@
+import tempfile
 import unittest
 from multiprocessing.connection import Pipe
 from unittest import TestCase
 from unittest.mock import patch
 
 from loop import ExtendedCtrl
+# noinspection PyProtectedMember
+from loop._song import Song
 
 r_conn, s_conn = Pipe(False)
+song_dir = tempfile.TemporaryDirectory()
+
+
+def setUpModule():
+    Song.save_dir = song_dir.name
+
+
+def tearDownModule():
+    Song.save_dir = "save_song"
 
 
 class TestExtendedCtrl(TestCase):
@@ -13,6 +25,7 @@ class TestExtendedCtrl(TestCase):
     @patch('tests.test_extendedctrl.ExtendedCtrl._save_song')
     def test_1(self, mock_method):
         control = ExtendedCtrl(s_conn)
+        mock_method.reset_mock()  # new song is saved when song directory is empty
         control.start()
         control.process_message(["_save_song"])
         mock_method.assert_called_once_with()
@@ -1,12 +1,56 @@
+import tempfile
 import unittest
 from multiprocessing import Pipe
 from unittest import TestCase
 from unittest.mock import MagicMock
 
+import numpy as np
+
+from drum import FakeDrum
+from loop import SongPart
 # noinspection PyProtectedMember
 from loop._looperctrl import LooperCtrl
+# noinspection PyProtectedMember
+from loop._loopsimple import LoopWithDrum
+# noinspection PyProtectedMember
+from loop._song import Song
+from utils import make_sin_sound, CHUNK_LEN, SD_TYPE
 
 r_conn, s_conn = Pipe(False)
+sound = make_sin_sound(300, 1)
+BLOCK = 512
+song_dir = tempfile.TemporaryDirectory()
+
+
+def setUpModule():
+    Song.save_dir = song_dir.name
+
+
+def tearDownModule():
+    Song.save_dir = "save_song"
+
+
+def play(control: LooperCtrl, blocks: int) -> np.ndarray:
+    """run stream callback as audio device does, returns output"""
+    out = np.zeros((BLOCK * blocks, 2), SD_TYPE)
+    for k in range(blocks):
+        # noinspection PyUnresolvedReferences
+        control._LooperCtrl__callback(sound[:BLOCK], out[k * BLOCK:(k + 1) * BLOCK], BLOCK, None, None)
+    return out
+
+
+def make_control(*lengths: int) -> LooperCtrl:
+    """stopped control with parts of one loop each, empty part for zero length"""
+    control = LooperCtrl()
+    control._redraw = MagicMock()
+    control._drum = FakeDrum()
+    control.items = [SongPart(control) for _ in lengths]
+    for part, length in zip(control.items, lengths):
+        if length:
+            part.items[0] = LoopWithDrum(control, length)
+            part.items[0].record_samples(sound[:length], 0)
+    control.now = control.next = 0
+    return control
 
 
 class TestLooperCtrl(TestCase):
@@ -20,6 +64,71 @@ class TestLooperCtrl(TestCase):
 
         control._play_part_id.assert_called_once_with(123)
 
+    def test_error_after_message(self):
+        """error of work done after message is logged, control keeps running"""
+        control = make_control(CHUNK_LEN)
+        control._update_stems = MagicMock(side_effect=AssertionError("failed"))
+        with self.assertLogs(level="ERROR"):
+            control.process_message(["_redraw"])
+        control._redraw.assert_called_once()
+
+    def test_swap_song(self):
+        control = LooperCtrl()
+        control._redraw = MagicMock()
+        parts = [SongPart(control), SongPart(control)]
+        parts[1].items[0] = LoopWithDrum(control, CHUNK_LEN * 2)
+        parts[1].items[0].record_samples(make_sin_sound(300, 1)[:CHUNK_LEN], 0)
+        control._swap_song("swapped.sng", 0, parts)  # song is stopped, it is swapped now
+
+        self.assertIs(control.items, parts)
+        self.assertEqual((control.now, control.next), (1, 1))
+        self.assertEqual(control._file_finder.get_item_now(), "swapped.sng")
+
+    def test_swap_song_in_callback(self):
+        control = make_control(CHUNK_LEN * 2)
+        parts = make_control(0, CHUNK_LEN).items
+        control._go_play.set()
+        play(control, 10)
+        control._swap_song("swapped.sng", 0, parts)
+        self.assertIsNot(control.items, parts)
+        play(control, CHUNK_LEN * 2 // BLOCK - 10 + 1)  # song changes at end of loop
+        self.assertIs(control.items, parts)
+        self.assertEqual((control.now, control.idx), (1, BLOCK))
+
+        # noinspection PyUnresolvedReferences
+        control._LooperCtrl__on_part_changed()
+        self.assertEqual(control._file_finder.get_item_now(), "swapped.sng")
+
+    def test_part_switch_in_callback(self):
+        control = make_control(CHUNK_LEN * 4, CHUNK_LEN * 2)
+        control._go_play.set()
+        play(control, 10)
+        self.assertEqual((control.now, control.idx), (0, BLOCK * 10))
+        control._play_part_id(1)  # part changes at end of part 0
+        play(control, CHUNK_LEN * 4 // BLOCK - 10)
+        self.assertEqual(control.now, 0)
+        play(control, 1)
+        self.assertEqual((control.now, control.idx), (1, BLOCK))
+
+    def test_trim_out_of_callback(self):
+        control = make_control(0)
+        control._go_play.set()
+        play(control, 20)
+        self.assertTrue(control.is_rec)
+        control.stop_now()
+        out = play(control, 2)  # recorded part plays while it waits for playback thread
+        self.assertTrue(control.get_item_now().is_empty)
+        self.assertFalse(control.is_rec)
+        np.testing.assert_equal(out[:BLOCK], sound[:BLOCK])
+
+        # noinspection PyUnresolvedReferences
+        control._LooperCtrl__on_part_changed()
+        self.assertEqual(control.get_item_now().length, BLOCK * 20)
+        out = play(control, 1)
+        self.assertFalse(control.is_rec)
+        self.assertEqual(control.idx, BLOCK * 3)
+        np.testing.assert_equal(out, sound[:BLOCK])
+
 
 if __name__ == "__main__":
     unittest.main()
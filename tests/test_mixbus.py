@@ -0,0 +1,44 @@
+import unittest
+from unittest import TestCase
+
+import numpy as np
+
+from utils import MixBus, GainStage, play_sound_buff, SD_MAX, MIX_TYPE
+
+
+class TestMixBus(TestCase):
+
+    def test_saturate(self):
+        bus = MixBus(8)
+        loud = np.full((12, 2), 30_000, 'int16')
+        mix = bus.get_block(10)
+        for _ in range(3):
+            play_sound_buff(loud, mix, 5)
+
+        out_data = np.zeros((10, 2), 'int16')
+        MixBus.clip_into(mix, out_data)
+        np.testing.assert_equal(out_data, SD_MAX)
+
+        mix = bus.get_block(4)
+        self.assertEqual(len(mix), 4)
+        self.assertFalse(mix.any())
+
+    def test_gain_ramp(self):
+        stage = GainStage(1.0, 1000)
+        block = np.full((300, 2), 1000, MIX_TYPE)
+        out_data = np.zeros((1500, 2), MIX_TYPE)
+        for pos in range(0, 1500, 300):
+            stage.add_into(block, out_data[pos:pos + 300], 0.5)
+
+        self.assertEqual(out_data[0, 0], 999)
+        self.assertTrue((np.diff(out_data[:1000, 0]) <= 0).all())
+        self.assertTrue((out_data[1000:] == 500).all())
+        self.assertEqual(stage.gain, 0.5)
+
+        expected = out_data[:300] + block // 2
+        stage.add_into(block, out_data[:300], 0.5)
+        np.testing.assert_equal(out_data[:300], expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
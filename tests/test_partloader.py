@@ -0,0 +1,64 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+
+from drum import FakeDrum
+from loop import SongPart
+# noinspection PyProtectedMember
+from loop._loopsimple import LoopWithDrum
+# noinspection PyProtectedMember
+from loop._oneloopctrl import OneLoopCtrl
+# noinspection PyProtectedMember
+from loop._partloader import PartLoader
+# noinspection PyProtectedMember
+from loop._songfile import SongFile
+from utils import make_sin_sound, CHUNK_LEN
+
+control = OneLoopCtrl()
+control._drum = FakeDrum()
+sound = make_sin_sound(300, 1)
+
+
+def make_part(k: int) -> SongPart:
+    part = SongPart(control)
+    part.items.clear()
+    loop = LoopWithDrum(control, CHUNK_LEN * (k + 1))
+    loop.record_samples(sound[:CHUNK_LEN], 0)
+    part.items.append(loop)
+    return part
+
+
+class TestPartLoader(TestCase):
+
+    def test_load(self):
+        saved = [make_part(0), None, make_part(2), make_part(3)]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "song.sng")
+            SongFile.save(path, 500, saved)
+            loader = PartLoader(path, control, 2)
+            self.assertEqual(loader.drum_length, 500)
+            self.assertFalse(loader.parts[2].is_empty)
+
+            changed = SongPart(control)
+            loader.parts[3] = changed
+            loader.wait_all()
+            self.assertIs(loader.parts[3], changed)
+            self.assertTrue(loader.parts[1].is_empty)
+            for k in [0, 2]:
+                np.testing.assert_equal(loader.parts[k].items[0].get_buff_copy(), saved[k].items[0].get_buff_copy())
+
+    def test_cancel(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "song.sng")
+            SongFile.save(path, 0, [make_part(k) for k in range(8)])
+            loader = PartLoader(path, control, 0)
+            loader.cancel()
+            loader.wait(7)
+            self.assertFalse(loader.parts[0].is_empty)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,16 @@
+import json
+import tempfile
 import unittest
+from pathlib import Path
 from unittest import TestCase
 
+import numpy as np
+
 from drum import RealDrum
+from drum._realdrum import Intensity
+# noinspection PyProtectedMember
+from drum._drumloader import DrumLoader
+from utils import MIX_TYPE
 
 drum = RealDrum()
 
@@ -15,6 +24,58 @@ class TestRealDrum(TestCase):
         drum.play_break_later(1000, 100)
         print(drum)
 
+    def test_use_set(self):
+        """prepared set is played at once, patterns are not prepared in the callback"""
+        drum_set = RealDrum.prepare_set(60_000)
+        self.assertEqual(drum_set.length, 60_000)
+        drum.use_set(drum_set)
+        self.assertEqual(drum.length, 60_000)
+        out = np.zeros((512, 2), MIX_TYPE)
+        drum.play_samples(out, 0)
+
+        # noinspection PyUnresolvedReferences
+        lock = DrumLoader._DrumLoader__lock
+        drum_set = RealDrum.prepare_set(50_000)
+        with lock:  # loader is busy, callback does not wait for it
+            drum.use_set(drum_set)
+            drum.play_samples(out, 0)
+            self.assertEqual(drum.length, 60_000)
+        drum.play_samples(out, 0)
+        self.assertEqual(drum.length, 50_000)
+
+    def test_break_at_sample(self):
+        """break starts half bar before end of part and stops half bar later"""
+        length = 40_000
+        DrumLoader.prepare_all(length)
+        test_drum = RealDrum()
+        test_drum.prepare_drum(length)
+
+        def play(idx: int, samples: int) -> bool:
+            for pos in range(idx, idx + samples, 512):
+                test_drum.play_samples(np.zeros((min(512, idx + samples - pos), 2), MIX_TYPE), pos)
+            return bool(test_drum._RealDrum__i & Intensity.BREAK)
+
+        self.assertFalse(play(0, 512))
+        test_drum.play_break_later(length * 2, 512)
+        start_at = length * 2 - length // 2
+        self.assertFalse(play(512, start_at - 512))
+        self.assertTrue(play(start_at, 1))
+        self.assertTrue(play(start_at + 1, length // 2 - 1))
+        self.assertFalse(play(length * 2, 1))
+
+    def test_no_correct_patterns(self):
+        """drum type with only incorrect patterns is not used"""
+        DrumLoader.prepare_all(40_000)
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ["drum_level1", "drum_level2", "drum_break"]:
+                with open(Path(tmp, name + ".json"), "w") as f:
+                    json.dump({"0": {"steps": 0}, "1": "not a pattern"}, f)
+            with self.assertLogs(level="ERROR"):
+                self.assertFalse(DrumLoader.load(Path(tmp)))
+        DrumLoader.random_samples()
+        DrumLoader.prepare_all(50_000)
+        self.assertEqual(len(DrumLoader.get_l1()), 50_000)
+
 
 if __name__ == "__main__":
     unittest.main()
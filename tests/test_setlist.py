@@ -0,0 +1,64 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+
+from drum import FakeDrum
+from loop import SongPart
+# noinspection PyProtectedMember
+from loop._loopsimple import LoopWithDrum
+# noinspection PyProtectedMember
+from loop._oneloopctrl import OneLoopCtrl
+# noinspection PyProtectedMember
+from loop._setlist import SetList
+# noinspection PyProtectedMember
+from loop._songfile import SongFile
+from utils import make_sin_sound, CHUNK_LEN
+
+control = OneLoopCtrl()
+control._drum = FakeDrum()
+sound = make_sin_sound(300, 1)
+
+
+def make_part(k: int) -> SongPart:
+    part = SongPart(control)
+    part.items.clear()
+    loop = LoopWithDrum(control, CHUNK_LEN * 2)
+    loop.record_samples(sound[:CHUNK_LEN] // (k + 1), 0)
+    part.items.append(loop)
+    return part
+
+
+class TestSetList(TestCase):
+
+    def test_step(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for k in range(3):
+                SongFile.save(Path(tmp, f"{k}.sng"), 100 * k, [make_part(k)])
+            file_name = Path(tmp, "set_list.json")
+            with open(file_name, "w") as f:
+                json.dump({"preload": 2, "songs": ["2.sng", "0.sng", "missing.sng", "1.sng"]}, f)
+
+            set_list = SetList(Path(tmp), str(file_name), control)
+            self.assertEqual(set_list.show(), "1/4 2.sng")
+            name, (length, parts) = set_list.step(go_fwd=True)
+            self.assertEqual((name, length), ("2.sng", 200))
+            np.testing.assert_equal(parts[0].items[0].get_buff_copy(), make_part(2).items[0].get_buff_copy())
+            self.assertEqual(set_list.step(go_fwd=True)[0], "0.sng")
+            self.assertEqual(set_list.step(go_fwd=True), ("missing.sng", None))
+            self.assertEqual(set_list.step(go_fwd=True)[1][0], 100)
+            self.assertEqual(set_list.step(go_fwd=True)[0], "2.sng")
+            self.assertEqual(set_list.step(go_fwd=False)[0], "1.sng")
+
+    def test_no_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            set_list = SetList(Path(tmp), str(Path(tmp, "set_list.json")), control)
+            self.assertTrue(set_list.is_empty)
+            self.assertEqual(set_list.step(go_fwd=True), ("", None))
+
+
+if __name__ == "__main__":
+    unittest.main()
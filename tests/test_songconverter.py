@@ -0,0 +1,94 @@
+import os
+import pickle
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+
+from drum import FakeDrum
+from loop import SongPart
+# noinspection PyProtectedMember
+from loop._loopsimple import LoopWithDrum
+# noinspection PyProtectedMember
+from loop._oneloopctrl import OneLoopCtrl
+# noinspection PyProtectedMember
+from loop._songconverter import SongConverter
+# noinspection PyProtectedMember
+from loop._songfile import SongFile
+from utils import make_sin_sound, CHUNK_LEN
+
+control = OneLoopCtrl()
+control._drum = FakeDrum()
+sound = make_sin_sound(300, 1)
+
+
+def make_part() -> SongPart:
+    part = SongPart(control)
+    part.items.clear()
+    for k in range(2):
+        loop = LoopWithDrum(control, CHUNK_LEN * 3)
+        loop.record_samples(sound[:CHUNK_LEN * 2] // (k + 1), CHUNK_LEN * k)
+        part.items.append(loop)
+    part.items[1].is_reverse = True
+    return part
+
+
+def save_pickle(path: Path, part: SongPart) -> None:
+    with open(path, "wb") as f:
+        pickle.dump((400, [part, None]), f)
+
+
+class TestSongConverter(TestCase):
+
+    def test_convert(self):
+        part = make_part()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "a.sng")
+            save_pickle(path, part)
+            backup_dir = Path(tmp, ".legacy")
+            self.assertEqual(SongConverter.find_legacy(Path(tmp), ".sng"), [path])
+
+            report = SongConverter.convert(path, backup_dir)
+            self.assertEqual(report["status"], "converted")
+            self.assertEqual(report["before"], os.path.getsize(Path(backup_dir, "a.sng")))
+            self.assertGreater(report["after"], 0)
+            self.assertTrue(SongFile.is_song_dir(path))
+            self.assertEqual(SongConverter.find_legacy(Path(tmp), ".sng"), [])
+
+            length, parts = SongFile.load(path, control)
+            self.assertEqual((length, len(parts)), (400, 2))
+            self.assertTrue(parts[1].is_empty)
+            for x, y in zip(part.items, parts[0].items):
+                np.testing.assert_equal(x.get_buff_copy(), y.get_buff_copy())
+            self.assertTrue(parts[0].items[1].is_reverse)
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "a.sng")
+            save_pickle(path, make_part())
+            backup_dir = Path(tmp, ".legacy")
+            # stopped after song was written and pickle was moved
+            SongFile.save(Path(str(path) + SongConverter.tmp_end), 400, [make_part()])
+            backup_dir.mkdir()
+            os.replace(path, Path(backup_dir, "a.sng"))
+
+            self.assertEqual(SongConverter.find_legacy(Path(tmp), ".sng"), [path])
+            self.assertEqual(SongConverter.convert(path, backup_dir)["status"], "resumed")
+            self.assertTrue(SongFile.is_song_dir(path))
+
+    def test_stale_output(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "a.sng")
+            save_pickle(path, make_part())
+            tmp_path = Path(str(path) + SongConverter.tmp_end)
+            tmp_path.mkdir()
+            Path(tmp_path, "partial").touch()  # stopped while song was written
+
+            self.assertEqual(SongConverter.convert(path, Path(tmp, ".legacy"))["status"], "converted")
+            self.assertFalse(os.path.exists(Path(path, "partial")))
+
+
+if __name__ == "__main__":
+    unittest.main()
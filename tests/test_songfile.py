@@ -0,0 +1,94 @@
+import os
+import pickle
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import TestCase, mock
+
+import numpy as np
+
+from drum import FakeDrum
+from loop import SongPart
+# noinspection PyProtectedMember
+from loop._loopsimple import LoopWithDrum
+# noinspection PyProtectedMember
+from loop._oneloopctrl import OneLoopCtrl
+# noinspection PyProtectedMember
+from loop._songfile import SongFile
+from utils import make_sin_sound, CHUNK_LEN
+
+control = OneLoopCtrl()
+control._drum = FakeDrum()
+sound = make_sin_sound(300, 1)
+
+
+def load_blob(path: Path, part_id: int, loop_id: int) -> np.ndarray:
+    content_hash = SongFile.read_manifest(path)["parts"][part_id]["loops"][loop_id]["blob"]
+    return np.load(SongFile.get_store(path).get_path(content_hash).with_suffix(".npy"))
+
+
+def make_part() -> SongPart:
+    part = SongPart(control)
+    part.items.clear()
+    for k in range(3):
+        loop = LoopWithDrum(control, CHUNK_LEN * 5)
+        loop.record_samples(sound[:CHUNK_LEN * 2] // (k + 1), CHUNK_LEN * k)
+        part.items.append(loop)
+    part.items[1].is_reverse = True
+    part.items[2].is_silent = True
+    part.now = part.next = 2
+    return part
+
+
+class TestSongFile(TestCase):
+
+    def test_round_trip(self):
+        part = make_part()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "song.sng")
+            SongFile.save(path, 1234, [part, None])
+            self.assertTrue(SongFile.is_song_dir(path))
+            length, parts = SongFile.load(path, control)
+
+            self.assertEqual(length, 1234)
+            self.assertEqual(len(parts), 2)
+            self.assertTrue(parts[1].is_empty)
+            self.assertEqual((parts[0].now, parts[0].next), (2, 2))
+            for x, y in zip(part.items, parts[0].items):
+                np.testing.assert_equal(x.get_buff_copy(), y.get_buff_copy())
+                self.assertEqual((x.is_reverse, x.is_silent), (y.is_reverse, y.is_silent))
+                self.assertEqual((x.peak, x.rms), (y.peak, y.rms))
+
+    def test_mapped_copy_on_write(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "song.sng")
+            SongFile.save(path, 0, [make_part()])
+            _, parts = SongFile.load(path, control)
+            loop = parts[0].items[0]
+            loop.record_samples(sound[:100], 0)
+
+            saved = load_blob(path, 0, 0)
+            self.assertFalse(np.array_equal(saved, loop.get_buff_copy()))
+            SongFile.save(path, 0, parts)
+            np.testing.assert_equal(load_blob(path, 0, 0), loop.get_buff_copy())
+            self.assertEqual(sorted(x.name for x in path.iterdir()), ["history.json", "song.json"])
+
+    def test_replace_pickle(self):
+        """pickle file is removed only after song directory is complete"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "song.sng")
+            with open(path, "wb") as f:
+                pickle.dump((0, [make_part()]), f)
+            _, parts = SongFile.load_pickle(path, control)
+
+            with mock.patch.object(SongFile, "_SongFile__write_json", side_effect=OSError("disk full")):
+                self.assertRaises(OSError, SongFile.save, path, 0, parts)
+            self.assertTrue(os.path.isfile(path))
+
+            SongFile.save(path, 0, parts)
+            self.assertTrue(SongFile.is_song_dir(path))
+            self.assertEqual(sorted(x.name for x in Path(tmp).iterdir()), [SongFile.blob_dir, "song.sng"])
+
+
+if __name__ == "__main__":
+    unittest.main()
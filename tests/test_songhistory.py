@@ -0,0 +1,121 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+
+from drum import FakeDrum
+from loop import SongPart
+# noinspection PyProtectedMember
+from loop._loopsimple import LoopWithDrum
+# noinspection PyProtectedMember
+from loop._oneloopctrl import OneLoopCtrl
+# noinspection PyProtectedMember
+from loop._songfile import SongFile
+# noinspection PyProtectedMember
+from loop._songhistory import SongHistory
+from utils import make_sin_sound, CHUNK_LEN
+
+control = OneLoopCtrl()
+control._drum = FakeDrum()
+sound = make_sin_sound(300, 1)
+
+
+def make_loop() -> (LoopWithDrum, list):
+    """loop with two undo levels and one redo level, returns loop and its states"""
+    loop = LoopWithDrum(control, CHUNK_LEN * 6)
+    loop.record_samples(sound[:CHUNK_LEN * 6], 0)
+    states = [loop.get_buff_copy()]
+    for k in range(3):
+        loop.save_undo()
+        loop.record_samples(sound[:CHUNK_LEN] // (k + 2), CHUNK_LEN * k)
+        states.append(loop.get_buff_copy())
+    loop.undo()
+    return loop, states
+
+
+class TestSongHistory(TestCase):
+
+    def test_undo_after_load(self):
+        loop, states = make_loop()
+        part = SongPart(control)
+        part.items.clear()
+        part.items.append(loop)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "song.sng")
+            SongFile.save(path, 0, [part])
+            self.assertTrue(Path(path, SongHistory.file_name).is_file())
+            _, parts = SongFile.load(path, control)
+            loaded = parts[0].items[0]
+
+            np.testing.assert_equal(loaded.get_buff_copy(), states[2])
+            self.assertEqual(loaded.get_undo_len(), 2)
+            self.assertEqual(loaded.history_bytes(), 0)  # history is not loaded yet
+            loaded.redo()
+            np.testing.assert_equal(loaded.get_buff_copy(), states[3])
+            for k in [2, 1, 0]:
+                loaded.undo()
+                np.testing.assert_equal(loaded.get_buff_copy(), states[k])
+
+    def test_save_twice_keeps_history(self):
+        loop, states = make_loop()
+        part = SongPart(control)
+        part.items.clear()
+        part.items.append(loop)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "song.sng")
+            SongFile.save(path, 0, [part])
+            _, parts = SongFile.load(path, control)
+            loaded = parts[0].items[0]
+            loaded.save_undo()
+            loaded.record_samples(sound[:CHUNK_LEN], CHUNK_LEN * 4)
+            SongFile.save(path, 0, parts)  # history of first save is not loaded yet
+            SongFile.collect_garbage(Path(tmp))
+
+            _, parts = SongFile.load(path, control)
+            loaded = parts[0].items[0]
+            self.assertEqual(loaded.get_undo_len(), 3)
+            for k in [2, 1, 0]:
+                loaded.undo()
+                np.testing.assert_equal(loaded.get_buff_copy(), states[k])
+
+    def test_backup_and_no_history(self):
+        loop, states = make_loop()
+        part = SongPart(control)
+        part.backup.append(loop)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "song.sng")
+            SongFile.save(path, 0, [part])
+            _, parts = SongFile.load(path, control)
+            self.assertEqual(len(parts[0].backup), 1)
+            np.testing.assert_equal(parts[0].backup[0].get_buff_copy(), states[2])
+            parts[0].backup[0].undo()
+            np.testing.assert_equal(parts[0].backup[0].get_buff_copy(), states[1])
+
+            SongFile.save(path, 0, [part], False)
+            self.assertFalse(Path(path, SongHistory.file_name).exists())
+            _, parts = SongFile.load(path, control)
+            self.assertEqual(len(parts[0].backup), 0)
+
+    def test_undo_after_save_without_history(self):
+        """history not loaded yet stays usable when its files are deleted"""
+        loop, states = make_loop()
+        part = SongPart(control)
+        part.items.clear()
+        part.items.append(loop)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "song.sng")
+            SongFile.save(path, 0, [part])
+            _, parts = SongFile.load(path, control)
+            SongFile.save(path, 0, parts, False)
+            self.assertGreater(SongFile.collect_garbage(Path(tmp)), 0)
+
+            loaded = parts[0].items[0]
+            for k in [1, 0]:
+                loaded.undo()
+                np.testing.assert_equal(loaded.get_buff_copy(), states[k])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import TestCase
+
+from drum import FakeDrum
+from loop import SongPart
+# noinspection PyProtectedMember
+from loop._loopsimple import LoopWithDrum
+# noinspection PyProtectedMember
+from loop._oneloopctrl import OneLoopCtrl
+# noinspection PyProtectedMember
+from loop._songfile import SongFile
+# noinspection PyProtectedMember
+from loop._songlibrary import SongLibrary
+from utils import make_sin_sound, CHUNK_LEN, SD_RATE
+
+control = OneLoopCtrl()
+control._drum = FakeDrum()
+sound = make_sin_sound(300, 1)
+
+
+def make_part(count: int) -> SongPart:
+    part = SongPart(control)
+    part.items.clear()
+    for k in range(count):
+        loop = LoopWithDrum(control, CHUNK_LEN * (k + 2))
+        loop.record_samples(sound[:CHUNK_LEN], 0)
+        part.items.append(loop)
+    return part
+
+
+class TestSongLibrary(TestCase):
+
+    def test_index(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            SongFile.save(Path(tmp, "a.sng"), 700, [make_part(2), None, make_part(1)])
+            with open(Path(tmp, "b.sng"), "wb") as f:
+                pickle.dump((300, [make_part(3)]), f)
+            Path(tmp, "other.txt").touch()
+
+            library = SongLibrary(Path(tmp), ".sng")
+            self.assertEqual(sorted(library.refresh()), ["a.sng", "b.sng"])
+            info = library.get("a.sng")
+            self.assertEqual((info["drum_length"], info["parts"], info["loops"]), (700, 2, [2, 0, 1]))
+            self.assertAlmostEqual(info["duration"], CHUNK_LEN * 5 / SD_RATE)
+            self.assertGreater(info["size"], CHUNK_LEN * 5)
+            info = library.get("b.sng")
+            self.assertEqual((info["drum_length"], info["parts"], info["loops"]), (300, 1, [3]))
+            self.assertIn("2p 2+1", library.info_str("a.sng"))
+
+            # unchanged songs are not read again
+            shutil.rmtree(Path(tmp, SongFile.blob_dir))
+            library = SongLibrary(Path(tmp), ".sng")
+            self.assertEqual(library.get("a.sng")["loops"], [2, 0, 1])
+
+            SongFile.save(Path(tmp, "a.sng"), 800, [make_part(1)])
+            SongFile.save(Path(tmp, "c.sng"), 800, [make_part(1)])
+            os.remove(Path(tmp, "b.sng"))
+            self.assertEqual(library.get("a.sng")["loops"], [2, 0, 1])  # get does not read songs
+            self.assertIsNone(library.get("c.sng"))
+            library.refresh()
+            self.assertEqual(library.get("c.sng")["loops"], [1])
+            self.assertEqual(library.get("a.sng")["loops"], [1])
+            self.assertIsNone(library.get("b.sng"))
+            self.assertEqual(library.info_str("b.sng"), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+from unittest import TestCase
+
+import numpy as np
+
+from drum import FakeDrum
+from loop import SongPart
+# noinspection PyProtectedMember
+from loop._loopsimple import LoopWithDrum
+# noinspection PyProtectedMember
+from loop._oneloopctrl import OneLoopCtrl
+from loop import WrapBuffer
+from utils import make_sin_sound, MIX_TYPE
+
+control = OneLoopCtrl()
+control._drum = FakeDrum()
+
+
+def make_part() -> SongPart:
+    part = SongPart(control)
+    part.items.clear()
+    for k, loop_len in enumerate([1000, 2000, 500]):
+        loop = LoopWithDrum(control, loop_len)
+        loop.record_samples(make_sin_sound(200 * (k + 1), 0.1)[:loop_len], 0)
+        part.items.append(loop)
+    return part
+
+
+def play(part: SongPart, idx: int) -> np.ndarray:
+    out_data = np.zeros((300, 2), MIX_TYPE)
+    part.play_samples(out_data, idx)
+    return out_data
+
+
+class TestSongPart(TestCase):
+
+    def test_stem(self):
+        part = make_part()
+        expected = play(part, 1900)
+        part.update_stem()
+        np.testing.assert_equal(play(part, 1900), expected)
+
+    def test_silent(self):
+        part = make_part()
+        part.update_stem()
+        part.items[1].is_silent = True
+        expected = play(part, 700)
+        part.update_stem()
+        np.testing.assert_equal(play(part, 700), expected)
+        part.items[2].is_reverse = True
+        expected = play(part, 700)
+        part.update_stem()
+        np.testing.assert_equal(play(part, 700), expected)
+
+    def test_overdub(self):
+        part = make_part()
+        part.update_stem()
+        stem = part._SongPart__stem
+        control._is_rec = True
+        part.now = 1
+        part.update_stem()
+        part.record_samples(make_sin_sound(300, 0.1)[:700], 1700)
+        control._is_rec = False
+        part.update_stem()
+        self.assertIs(part._SongPart__stem, stem)
+
+        expected = np.zeros((300, 2), MIX_TYPE)
+        for loop in part.items:
+            WrapBuffer.play_samples(loop, expected, 1900)
+        np.testing.assert_equal(play(part, 1900), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+
+from drum import FakeDrum
+from loop import SongPart
+# noinspection PyProtectedMember
+from loop._loopsimple import LoopWithDrum
+# noinspection PyProtectedMember
+from loop._oneloopctrl import OneLoopCtrl
+# noinspection PyProtectedMember
+from loop._songfile import SongFile
+# noinspection PyProtectedMember
+from loop._songsaver import SongSaver
+from utils import make_sin_sound, CHUNK_LEN
+
+control = OneLoopCtrl()
+control._drum = FakeDrum()
+sound = make_sin_sound(300, 1)
+
+
+def load_blob(path: Path, part_id: int, loop_id: int) -> np.ndarray:
+    content_hash = SongFile.read_manifest(path)["parts"][part_id]["loops"][loop_id]["blob"]
+    return np.load(SongFile.get_store(path).get_path(content_hash).with_suffix(".npy"))
+
+
+def make_part() -> SongPart:
+    part = SongPart(control)
+    part.items.clear()
+    loop = LoopWithDrum(control, CHUNK_LEN * 6)
+    loop.record_samples(sound[:CHUNK_LEN * 3], 0)
+    part.items.append(loop)
+    return part
+
+
+class TestSongSaver(TestCase):
+
+    def test_snapshot(self):
+        """loop changed after snapshot is saved as it was"""
+        part = make_part()
+        loop = part.items[0]
+        expected = loop.get_buff_copy()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "song.sng")
+            snapshot = SongFile.snapshot(0, [part])
+            loop.save_undo()
+            loop.record_samples(sound[:CHUNK_LEN * 2], CHUNK_LEN * 2)
+            loop.undo()
+            loop.redo()
+            loop.zero_buff()
+            SongFile.write(path, snapshot)
+            np.testing.assert_equal(load_blob(path, 0, 0), expected)
+
+            _, parts = SongFile.load(path, control)
+            self.assertEqual(parts[0].items[0].peak, np.abs(expected).max())
+
+    def test_background(self):
+        statuses = []
+        saver = SongSaver(lambda: statuses.append(saver.status))
+        part = make_part()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "song.sng")
+            saver.save(path, 100, [part, None], True)
+            part.items[0].record_samples(sound[:CHUNK_LEN], 0)
+            saver.wait()
+            self.assertEqual(statuses[0], "saving")
+            self.assertEqual(statuses[-1], "saved")
+            self.assertEqual(SongFile.read_manifest(path)["drum_length"], 100)
+            self.assertFalse(Path(tmp, "song.sng.tmp").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
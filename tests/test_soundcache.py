@@ -0,0 +1,43 @@
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+import soundfile as sf
+
+# noinspection PyProtectedMember
+from drum._soundcache import SoundCache
+from utils import SD_RATE
+
+
+class TestSoundCache(TestCase):
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            sound = (np.sin(np.arange(4800) / 10) * 10_000).astype('int16')
+            sf.write(Path(tmp_dir, "hit.wav"), sound, 48_000, subtype="PCM_16")
+            json_path = Path(tmp_dir, "drum_sounds.json")
+            with open(json_path, "w") as f:
+                json.dump({"hit": {"file_name": "hit.wav", "volume": 0.5}}, f)
+
+            decoded, volume, peak = SoundCache.load(json_path)["hit"]
+            self.assertEqual(decoded.shape, (round(4800 * SD_RATE / 48_000), 2))
+            self.assertEqual(volume, 0.5)
+            self.assertEqual(peak, np.max(decoded))
+            self.assertNotIsInstance(decoded, np.memmap)
+
+            mapped, _, _ = SoundCache.load(json_path)["hit"]
+            self.assertIsInstance(mapped, np.memmap)
+            np.testing.assert_equal(mapped, decoded)
+
+            sf.write(Path(tmp_dir, "hit.wav"), sound[:2400], SD_RATE, subtype="PCM_16")
+            os.utime(Path(tmp_dir, "hit.wav"), ns=(0, 0))
+            changed, _, _ = SoundCache.load(json_path)["hit"]
+            self.assertEqual(len(changed), 2400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+from unittest import TestCase
+
+import numpy as np
+
+# noinspection PyProtectedMember
+from drum._stepmatrix import StepMatrix
+
+sounds = ["kick", "snare", "hi_hat"]
+
+
+class TestStepMatrix(TestCase):
+
+    def test_compile(self):
+        matrix = StepMatrix("0", {"steps": 8, "accents": "59", "kick": "!...", "hi_hat": "!!", "___": "1234"}, sounds)
+        self.assertEqual(matrix.sounds, ("kick", "hi_hat"))
+        np.testing.assert_equal(matrix.accents, [5, 9, 5, 9, 5, 9, 5, 9])
+        np.testing.assert_equal(matrix.hits[0], [1, 0, 0, 0, 1, 0, 0, 0])
+        np.testing.assert_equal(matrix.hits[1], [1] * 8)
+
+    def test_key(self):
+        pattern = {"steps": 4, "accents": "9", "kick": "!.", "snare": ".!"}
+        first = StepMatrix("0", pattern, sounds)
+        second = StepMatrix("1", dict(pattern, snare=".!.!"), sounds)
+        third = StepMatrix("2", dict(pattern, snare="!!.."), sounds)
+        self.assertEqual(first.key, second.key)
+        self.assertNotEqual(first.key, third.key)
+
+    def test_reject(self):
+        good = {"steps": 4, "accents": "9", "kick": "!..."}
+        for bad in [dict(good, steps=0), dict(good, steps="4"), dict(good, accents="9a"),
+                    dict(good, accents=""), dict(good, kick="!x.."), dict(good, kick="")]:
+            with self.assertRaises(ValueError):
+                StepMatrix("bad", bad, sounds)
+
+
+if __name__ == "__main__":
+    unittest.main()
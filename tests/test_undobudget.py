@@ -0,0 +1,138 @@
+import copy
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+
+from drum import FakeDrum
+from loop import SongPart
+# noinspection PyProtectedMember
+from loop._loopsimple import LoopWithDrum
+# noinspection PyProtectedMember
+from loop._oneloopctrl import OneLoopCtrl
+# noinspection PyProtectedMember
+from loop._songfile import SongFile
+# noinspection PyProtectedMember
+from loop._undobudget import UndoBudget
+from utils import make_sin_sound, CHUNK_LEN
+
+control = OneLoopCtrl()
+control._drum = FakeDrum()
+sound = make_sin_sound(300, 1)
+
+
+def make_part(levels: int) -> (SongPart, list):
+    """loop with undo levels, each overdub changes one chunk"""
+    part = SongPart(control)
+    part.items.clear()
+    loop = LoopWithDrum(control, CHUNK_LEN * 8)
+    part.items.append(loop)
+    loop.record_samples(sound[:loop.length], 0)
+    states = []
+    for k in range(levels):
+        states.append(loop.get_buff_copy())
+        loop.save_undo()
+        loop.record_samples(sound[:100] // (k + 2), k * CHUNK_LEN)
+    return part, states
+
+
+def chunk_mb(loop: LoopWithDrum) -> float:
+    return CHUNK_LEN * loop.nbytes / loop.length / 1024 / 1024
+
+
+class TestUndoBudget(TestCase):
+
+    def test_drop(self):
+        part, states = make_part(6)
+        loop = part.items[0]
+        budget = UndoBudget(chunk_mb(loop) * 3.5, False)
+        budget.enforce([part])
+        self.assertLessEqual(budget.used, budget.limit)
+        self.assertEqual(loop.get_undo_len(), 3)
+        for k in range(3):
+            loop.undo()
+            np.testing.assert_equal(loop.get_buff_copy(), states[-k - 1])
+
+    def test_drop_by_position(self):
+        """entries are dropped from start of undo even if their seq is out of order"""
+        part, states = make_part(6)
+        loop = part.items[0]
+        for k, entry in enumerate(loop.old_entries()):
+            entry.seq = -k
+        self.assertFalse(loop.drop_entry(loop.old_entries()[1]))
+        budget = UndoBudget(chunk_mb(loop) * 3.5, False)
+        budget.enforce([part])
+        self.assertEqual(budget.used, budget.measure([part]))
+        self.assertEqual(loop.get_undo_len(), 3)
+        for k in range(3):
+            loop.undo()
+            np.testing.assert_equal(loop.get_buff_copy(), states[-k - 1])
+
+    def test_spill(self):
+        part, states = make_part(6)
+        loop = part.items[0]
+        budget = UndoBudget(chunk_mb(loop) / 2, True)
+        budget.enforce([part])
+        self.assertLessEqual(budget.used, chunk_mb(loop) * 1024 * 1024)
+        self.assertEqual(loop.get_undo_len(), 6)
+        for k in range(6):
+            loop.undo()
+            np.testing.assert_equal(loop.get_buff_copy(), states[-k - 1])
+        for k in range(6):
+            loop.redo()
+        budget.enforce([part])
+        self.assertLessEqual(budget.used, chunk_mb(loop) * 1024 * 1024)
+
+    def test_loaded_song(self):
+        """chunks copied from mapped buffer of loaded song are counted as memory"""
+        part, _ = make_part(0)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "song.sng")
+            SongFile.save(path, 0, [part], False)
+            _, parts = SongFile.load(path, control)
+            loop = parts[0].items[0]
+            for k in range(6):
+                loop.save_undo()
+                loop.record_samples(sound[:100], k * CHUNK_LEN)
+            budget = UndoBudget(chunk_mb(loop) * 3.5, False)
+            self.assertAlmostEqual(budget.measure(parts), chunk_mb(loop) * 6 * 1024 * 1024)
+            budget.enforce(parts)
+            self.assertEqual(loop.get_undo_len(), 3)
+            duplicate = copy.deepcopy(loop)
+            self.assertEqual(duplicate.history_bytes(), loop.history_bytes())
+
+    def test_loaded_history(self):
+        """history loaded from sidecar is older than entries made after song was loaded"""
+        part, _ = make_part(4)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "song.sng")
+            SongFile.save(path, 0, [part])
+            _, parts = SongFile.load(path, control)
+            loop = parts[0].items[0]
+            states = []
+            for k in range(3):
+                states.append(loop.get_buff_copy())
+                loop.save_undo()
+                loop.record_samples(sound[:100], (k + 4) * CHUNK_LEN)
+            loop.load_history()
+            self.assertEqual(loop.get_undo_len(), 7)
+
+            budget = UndoBudget(chunk_mb(loop) * 1.5, False)
+            budget.enforce(parts)
+            self.assertLessEqual(budget.used, budget.limit)
+            self.assertEqual(loop.get_undo_len(), 1)
+            loop.undo()
+            np.testing.assert_equal(loop.get_buff_copy(), states[-1])
+
+    def test_deleted_loops(self):
+        part, _ = make_part(1)
+        part.backup.append(part.items[0])
+        budget = UndoBudget(0.01, False)
+        budget.enforce([part])
+        self.assertEqual(len(part.backup), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
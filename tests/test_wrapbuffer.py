@@ -1,8 +1,10 @@
 import unittest
 from unittest import TestCase
 
+import numpy as np
+
 from loop import WrapBuffer
-from utils import make_sin_sound, SD_RATE, STATE_COLS, SCR_COLS
+from utils import make_sin_sound, SD_RATE, STATE_COLS, SCR_COLS, CHUNK_LEN, MIX_TYPE, find_chunk_stats
 
 sound_len = 500_000  # samples
 sound = make_sin_sound(440, sound_len / SD_RATE)
@@ -41,6 +43,75 @@ class TestWrapBuffer(TestCase):
 
         self.assertTrue(had_error)
 
+    def test_short_loop(self):
+        test_buff = WrapBuffer()
+        test_buff.record_samples(sound[:1000], 0)
+        test_buff.finalize(1000, 0)
+        self.assertEqual(test_buff.length, 1000)
+        self.assertEqual(test_buff.peak, np.abs(sound[:1000].astype(MIX_TYPE)).max())
+        peaks, squares = find_chunk_stats(sound[:0])
+        self.assertEqual((len(peaks), len(squares)), (0, 0))
+
+    def test_undo_chunks(self):
+        test_buff = WrapBuffer(121_000, 2)
+        test_buff.record_samples(sound[:121_000], 0)
+        before = test_buff.get_buff_copy()
+        test_buff.save_undo()
+        test_buff.record_samples(sound[:1000], 8000)
+        after = test_buff.get_buff_copy()
+        # noinspection PyUnresolvedReferences
+        self.assertEqual(test_buff._WrapBuffer__undo[0].nbytes, 2 * CHUNK_LEN * after.itemsize * 2)
+
+        test_buff.undo()
+        self.assertTrue((test_buff.get_buff_copy() == before).all())
+        test_buff.redo()
+        self.assertTrue((test_buff.get_buff_copy() == after).all())
+
+    def test_mono(self):
+        test_buff = WrapBuffer(1000, 1)
+        test_buff.record_samples(sound[:1000], 0)
+        self.assertEqual(test_buff.get_buff_copy().shape, (1000, 1))
+        out_data = np.zeros((300, 2), MIX_TYPE)
+        test_buff.play_samples(out_data, 900)
+        self.assertTrue((out_data[:, 0] == out_data[:, 1]).all())
+        self.assertTrue((out_data[:100, 0] == sound[900:1000, 0]).all())
+
+        acc = np.zeros((2000, 2), MIX_TYPE)
+        test_buff.mix_into(acc, False)
+        self.assertTrue((acc[1000:] == acc[:1000]).all())
+        self.assertTrue((acc[900:1000, 1] == sound[900:1000, 1]).all())
+
+    def test_sparse(self):
+        test_buff = WrapBuffer(CHUNK_LEN * 4, 2)
+        test_buff.save_undo()
+        test_buff.record_samples(sound[:100], CHUNK_LEN * 2 + 10)
+        # noinspection PyUnresolvedReferences
+        self.assertEqual(test_buff._WrapBuffer__undo[0].nbytes, 0)
+
+        out_data = np.zeros((CHUNK_LEN, 2), MIX_TYPE)
+        test_buff.play_samples(out_data, 0)
+        self.assertFalse(out_data.any())
+        test_buff.play_samples(out_data, CHUNK_LEN * 2)
+        self.assertTrue((out_data[10:110] == sound[:100]).all())
+
+        acc = np.zeros((CHUNK_LEN * 4, 2), MIX_TYPE)
+        test_buff.mix_into(acc, False)
+        self.assertTrue((acc == test_buff.get_buff_copy()).all())
+        test_buff.undo()
+        self.assertFalse(test_buff.get_buff_copy().any())
+
+    def test_peak(self):
+        test_buff = WrapBuffer(CHUNK_LEN * 4, 2)
+        self.assertEqual(test_buff.peak, 0)
+        test_buff.record_samples(sound[:CHUNK_LEN * 4], 0)
+        self.assertEqual(test_buff.peak, np.abs(sound[:CHUNK_LEN * 4].astype(MIX_TYPE)).max())
+        test_buff.save_undo()
+        test_buff.record_samples(-sound[:CHUNK_LEN * 4], 0)
+        self.assertEqual(test_buff.peak, 0)
+        self.assertEqual(test_buff.rms, 0)
+        test_buff.undo()
+        self.assertAlmostEqual(test_buff.rms, np.sqrt((sound[:CHUNK_LEN * 4].astype(float) ** 2).mean()))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,7 +1,10 @@
 # alsa
-from utils._utilsalsa import MAX_LEN, SD_MAX, MAX_32_INT, SD_TYPE, SD_RATE
-from utils._utilsalsa import make_zero_buffer, record_sound_buff, play_sound_buff
+from utils._utilsalsa import MAX_LEN, SD_MAX, MAX_32_INT, SD_TYPE, SD_RATE, CHUNK_LEN
+from utils._utilsalsa import make_zero_buffer, record_sound_buff, play_sound_buff, fit_channels, IN_CH
+from utils._utilsalsa import find_chunk_stats
 from utils._utilsalsa import sound_test, make_changing_sound, make_sin_sound, open_midi_ports
+from utils._utilsmix import MixBus, GainStage, MIX_TYPE
+from utils._utilspool import BufferPool, buffer_pool
 
 from utils._utilsloader import JsonDictLoader, MainLoader
 
@@ -79,11 +79,35 @@ def calc_slices(buff_len: int, data_len: int, idx: int) -> Tuple[slice, Union[sl
         return slice(idx1, buff_len), slice(0, idx2)
 
 
+def fit_channels(np_data: np.ndarray, channels: int) -> np.ndarray:
+    """mono data is broadcast to stereo, stereo data is mixed down to mono"""
+    if np_data.shape[1] == channels:
+        return np_data
+    if channels == 2:
+        return np.broadcast_to(np_data, (len(np_data), 2))
+    return (np_data.sum(axis=1, keepdims=True, dtype='int32') // 2).astype(np_data.dtype)
+
+
+def find_chunk_stats(buff: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """peak and sum of squares of each chunk of buffer, last chunk may be partial or the only one"""
+    full = len(buff) // CHUNK_LEN
+    peaks = np.zeros(-(-len(buff) // CHUNK_LEN), np.int32)
+    squares = np.zeros(len(peaks), np.float64)
+    # row size is given, reshape can not find it for buffer shorter than one chunk
+    chunks = buff[:full * CHUNK_LEN].reshape((full, CHUNK_LEN * int(np.prod(buff.shape[1:]))))
+    peaks[:full] = np.maximum(chunks.max(axis=1, initial=0), -chunks.min(axis=1, initial=0).astype(np.int32))
+    squares[:full] = np.einsum("ij,ij->i", chunks, chunks, dtype=np.float64)
+    if full < len(peaks):
+        tail = buff[full * CHUNK_LEN:]
+        peaks[full] = max(int(tail.max()), -int(tail.min()))
+        squares[full] = np.einsum("ij,ij->", tail, tail, dtype=np.float64)
+    return peaks, squares
+
+
 def record_sound_buff(buff: np.ndarray, np_data: np.ndarray, idx: int) -> None:
     assert buff.ndim == np_data.ndim
     data_len = len(np_data)
-    if IN_CH == 1:
-        np_data = np.broadcast_to(np_data, (data_len, 2))
+    np_data = fit_channels(np_data, buff.shape[1])
     slice1, slice2 = calc_slices(len(buff), data_len, idx)
     if slice2 is None:
         buff[slice1] += np_data[:]
@@ -112,19 +136,20 @@ SD_TYPE: str = 'int16'
 sd.default.dtype = [SD_TYPE, SD_TYPE]
 sd.default.latency = ('low', 'low')
 MAX_LEN: int = int(os.getenv("MAX_LEN_SECONDS", "60")) * SD_RATE
+CHUNK_LEN: int = 4096  # loops are saved for undo by chunks of this many samples
 MAX_32_INT = 2 ** 32 - 1
 SD_MAX: int = np.iinfo(SD_TYPE).max
 
 
-def make_zero_buffer(buff_len: int) -> np.ndarray:
-    if buff_len < 0 or buff_len > MAX_LEN:
-        raise ValueError(f"make_zero_buffer() incorrect parameter: {buff_len}")
-    return np.zeros((buff_len, 2), SD_TYPE)
+def make_zero_buffer(buff_len: int, channels: int = 2) -> np.ndarray:
+    if buff_len < 0 or buff_len > MAX_LEN or channels not in [1, 2]:
+        raise ValueError(f"make_zero_buffer() incorrect parameter: {buff_len} {channels}")
+    return np.zeros((buff_len, channels), SD_TYPE)
 
 
 def sound_test(buffer: np.ndarray, duration_sec: float, record: bool) -> None:
-    if not (buffer.ndim == 2 and buffer.shape[1] == 2):
-        raise RuntimeError("Buffer for playback must have 2 channels")
+    if not (buffer.ndim == 2 and buffer.shape[1] in [1, 2]):
+        raise RuntimeError("Buffer for playback must have 1 or 2 channels")
     idx = 0
 
     # noinspection PyUnusedLocal
@@ -63,6 +63,14 @@ class MainLoader:
         MainLoader.__dl.add_if_missing(ConfigName.drum_swing, 0.75)
         MainLoader.__dl.add_if_missing(ConfigName.drum_volume, 0.3)
         MainLoader.__dl.add_if_missing(ConfigName.drum_type, "pop")
+        MainLoader.__dl.add_if_missing(ConfigName.drum_mode, "render")
+        MainLoader.__dl.add_if_missing(ConfigName.undo_memory_mb, 256)
+        MainLoader.__dl.add_if_missing(ConfigName.undo_spill, False)
+        MainLoader.__dl.add_if_missing(ConfigName.undo_spill_dir, "")
+        MainLoader.__dl.add_if_missing(ConfigName.song_lazy_load, True)
+        MainLoader.__dl.add_if_missing(ConfigName.song_save_background, True)
+        MainLoader.__dl.add_if_missing(ConfigName.song_save_history, True)
+        MainLoader.__dl.add_if_missing(ConfigName.set_list, "etc/set_list.json")
 
 
 if __name__ == "__main__":
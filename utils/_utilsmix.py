@@ -0,0 +1,90 @@
+import numpy as np
+
+from utils._utilsalsa import SD_TYPE, SD_MAX
+
+MIX_TYPE: str = 'int32'
+SD_MIN: int = np.iinfo(SD_TYPE).min
+
+
+class MixBus:
+    """Accumulator for one audio block. Loops and drums are added to it in int32
+    so they do not wrap around, result is clipped once into int16 output"""
+
+    def __init__(self, block_len: int = 4096):
+        self.__acc: np.ndarray = np.zeros((block_len, 2), MIX_TYPE)
+
+    def get_block(self, frame_count: int) -> np.ndarray:
+        """zeroed view of accumulator, it is reallocated only if audio block is longer than before"""
+        if frame_count > len(self.__acc):
+            self.__acc = np.zeros((frame_count, 2), MIX_TYPE)
+        block = self.__acc[:frame_count]
+        block[:] = 0
+        return block
+
+    @staticmethod
+    def clip_into(block: np.ndarray, out_data: np.ndarray) -> None:
+        np.clip(block, SD_MIN, SD_MAX, out=block)
+        out_data[:] = block
+
+
+class GainStage:
+    """Gain applied when block is added to output. When gain changes it is ramped
+    over ramp_len samples to avoid zipper noise. Scaled block is kept in preallocated buffer"""
+
+    def __init__(self, gain: float = 1.0, ramp_len: int = 2048, block_len: int = 4096):
+        self.__gain: float = gain
+        self.__ramp_len: int = ramp_len
+        self.__ramp_start: float = gain
+        self.__ramp_target: float = gain
+        self.__ramp_pos: int = ramp_len
+        self.__tmp: np.ndarray = np.zeros((block_len, 2))
+        self.__gains: np.ndarray = np.zeros(block_len)
+        self.__steps: np.ndarray = np.arange(1, block_len + 1, dtype=np.float64)
+
+    @property
+    def gain(self) -> float:
+        return self.__gain
+
+    def add_into(self, block: np.ndarray, out_data: np.ndarray, target: float) -> None:
+        """add block multiplied by gain to out_data, gain moves to target"""
+        if target != self.__ramp_target:
+            self.__ramp_start, self.__ramp_target, self.__ramp_pos = self.__gain, target, 0
+
+        if self.__ramp_pos >= self.__ramp_len:
+            if target == 1:
+                out_data += block
+            else:
+                tmp = self.__get_tmp(block)
+                np.multiply(block, target, out=tmp)
+                GainStage.__add_trunc(tmp, out_data)
+            return
+
+        tmp = self.__get_tmp(block)
+        gains = self.__gains[:len(block)]
+        np.add(self.__steps[:len(block)], self.__ramp_pos, out=gains)
+        gains /= self.__ramp_len
+        np.minimum(gains, 1, out=gains)
+        gains *= target - self.__ramp_start
+        gains += self.__ramp_start
+        np.multiply(block, gains[:, np.newaxis], out=tmp)
+        GainStage.__add_trunc(tmp, out_data)
+        self.__ramp_pos += len(block)
+        self.__gain = float(gains[-1]) if len(gains) else self.__gain
+
+    def __get_tmp(self, block: np.ndarray) -> np.ndarray:
+        """view of float buffer, it is reallocated only if audio block is longer than before"""
+        if len(block) > len(self.__tmp) or block.shape[1:] != self.__tmp.shape[1:]:
+            self.__tmp = np.zeros(block.shape)
+            self.__gains = np.zeros(len(block))
+            self.__steps = np.arange(1, len(block) + 1, dtype=np.float64)
+        return self.__tmp[:len(block)]
+
+    @staticmethod
+    def __add_trunc(tmp: np.ndarray, out_data: np.ndarray) -> None:
+        """scaled samples are truncated to integers before they are added"""
+        np.trunc(tmp, out=tmp)
+        np.add(out_data, tmp, out=out_data, casting="unsafe")
+
+
+if __name__ == "__main__":
+    pass
@@ -112,18 +112,18 @@ class CollectionOwner(Generic[T]):
 
 
 class FileFinder(CollectionOwner[str]):
-    def __init__(self, dir_name: Union[str, Path], is_file: bool, end_with: str, initial: str):
+    def __init__(self, dir_name: Union[str, Path], is_file: Union[bool, None], end_with: str, initial: str):
+        """is_file None means both files and directories"""
         super().__init__()
         self.__end_with = end_with
         self.__dir_name = Path(ROOT_DIR, dir_name)
         self.__dir_name.mkdir(parents=True, exist_ok=True)
 
-        def chk_file(d, f):
-            return os.path.isfile(os.path.join(d, f))
-
-        self.items = [p for p in os.listdir(self.__dir_name)
-                      if is_file == chk_file(self.__dir_name, p)
-                      and p.endswith(self.__end_with)]
+        # type of entry comes with directory listing, entries are not checked one by one
+        with os.scandir(self.__dir_name) as entries:
+            self.items = [p.name for p in entries
+                          if is_file in [None, p.is_file()]
+                          and p.name.endswith(self.__end_with)]
 
         if initial and initial in self.items:
             self.now = self.items.index(initial)
@@ -163,8 +163,16 @@ class ConfigName:
     drum_swing: str = "DRUM_SWING"
     drum_type: str = "DRUM_TYPE"
     drum_volume: str = "DRUM_VOLUME"
+    drum_mode: str = "DRUM_MODE"
     usb_audio_names: str = "USB_AUDIO_NAMES"
     max_late_seconds: str = "MAX_LATE_SECONDS"
+    undo_memory_mb: str = "UNDO_MEMORY_MB"
+    undo_spill: str = "UNDO_SPILL"
+    undo_spill_dir: str = "UNDO_SPILL_DIR"
+    song_lazy_load: str = "SONG_LAZY_LOAD"
+    song_save_background: str = "SONG_SAVE_BACKGROUND"
+    song_save_history: str = "SONG_SAVE_HISTORY"
+    set_list: str = "SET_LIST"
 
 
 if __name__ == "__main__":
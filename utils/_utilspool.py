@@ -0,0 +1,105 @@
+import time
+from threading import Thread, Lock, Event
+from typing import List, Tuple, Union
+
+import numpy as np
+
+from utils._utilsalsa import MAX_LEN, CHUNK_LEN, IN_CH, make_zero_buffer
+
+
+class BufferPool:
+    """Zeroed recording buffers prepared in advance, so pressing a pedal does not allocate.
+    Buffer is cut from the smallest free extent that fits, rest of extent stays free.
+    Empty loops keep MAX_LEN buffers that are not paged in until they are recorded,
+    only reserve extents are paged in ahead of time.
+    Returned buffers and trimmed tails are zeroed by background thread and used again"""
+
+    def __init__(self, reserve: int = 2, grace_sec: float = 0.5, channels: int = 2):
+        self.__reserve: int = reserve  # count of MAX_LEN extents kept ready
+        self.__channels: int = channels  # channels of extents kept ready
+        self.__grace: float = grace_sec  # audio callback may use returned buffer for a short time
+        self.__free: List[np.ndarray] = []
+        self.__returned: List[Tuple[float, np.ndarray]] = []
+        self.__lock: Lock = Lock()
+        self.__wake: Event = Event()
+        self.__thread: Union[Thread, None] = None
+
+    def take(self, length: int, channels: int = 2, from_reserve: bool = False) -> np.ndarray:
+        """zeroed buffer, it is allocated only if no free extent fits. Buffer of empty loop is not cut
+        from reserve unless it is recorded at once, otherwise its pages are mapped by system when it is recorded"""
+        self.__start()
+        if length >= MAX_LEN and not from_reserve:
+            return make_zero_buffer(length, channels)
+        extent = None
+        with self.__lock:
+            fits = [k for k, x in enumerate(self.__free) if len(x) >= length and x.shape[1] == channels]
+            if fits:
+                extent = self.__free.pop(min(fits, key=lambda k: len(self.__free[k])))
+                if len(extent) - length >= CHUNK_LEN:
+                    self.__free.append(extent[length:])
+
+        self.__wake.set()
+        if extent is None:
+            return make_zero_buffer(length, channels)
+        return extent[:length]
+
+    def give(self, buff: np.ndarray) -> None:
+        """buffer is not used any more, it will be zeroed and given again. Mapped files are not kept"""
+        if len(buff) >= CHUNK_LEN and not isinstance(buff, np.memmap):
+            with self.__lock:
+                self.__returned.append((time.monotonic(), buff))
+            self.__wake.set()
+
+    @property
+    def free_len(self) -> int:
+        with self.__lock:
+            return sum(len(x) for x in self.__free)
+
+    def __start(self) -> None:
+        if self.__thread is None:
+            self.__thread = Thread(target=self.__run, name="buffer_pool_thread", daemon=True)
+            self.__thread.start()
+
+    def __run(self) -> None:
+        while True:
+            self.__wake.wait(self.__grace)
+            self.__wake.clear()
+            self.__zero_returned()
+            self.__fill_reserve()
+
+    def __zero_returned(self) -> None:
+        now = time.monotonic()
+        with self.__lock:
+            ready = [x for t, x in self.__returned if now - t >= self.__grace]
+            self.__returned = [(t, x) for t, x in self.__returned if now - t < self.__grace]
+
+        for buff in ready:
+            buff[:] = 0
+
+        with self.__lock:
+            self.__free.extend(ready)
+            # keep longest extents, others are dropped from pool. Their memory is freed
+            # only when no loop keeps a slice of the same buffer
+            self.__free.sort(key=len, reverse=True)
+            total = 0
+            for k, x in enumerate(self.__free):
+                total += len(x)
+                if total > (self.__reserve + 1) * MAX_LEN:
+                    del self.__free[k:]
+                    break
+
+    def __fill_reserve(self) -> None:
+        with self.__lock:
+            missing = self.__reserve - sum(1 for x in self.__free if x.shape == (MAX_LEN, self.__channels))
+
+        for _ in range(missing):
+            buff = make_zero_buffer(MAX_LEN, self.__channels)
+            buff.fill(0)  # touch memory pages now, not when recording
+            with self.__lock:
+                self.__free.append(buff)
+
+
+buffer_pool: BufferPool = BufferPool(channels=IN_CH)
+
+if __name__ == "__main__":
+    pass